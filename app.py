@@ -1,50 +1,134 @@
 
 # ------------------------- app.py -------------------------
-from dash import Dash, html, dash_table, dcc, Input, Output, State, ALL
+import time
+_import_started = time.perf_counter()
+
+import logging
+from dash import Dash, html, dash_table, dcc, Input, Output, State, ALL, MATCH
 import dash 
+from dash.exceptions import MissingCallbackContextException
+import os
 import pandas as pd
-from calculations import general_calc, calculate_hf, calculate_ltv, hf_ratio_description, stress_test_calculation_multiple
-from fetch_data import get_reserves
+from calculations import general_calc, calculate_hf, calculate_ltv, hf_ratio_description, stress_test_calculation_multiple, stress_response_surface, liquidation_prices, price_sensitivities
+from coin_search import coin_index
+from fetch_data import ReserveCache
+from shared_reserves import RESERVE_SHM_DIR, SharedReserveTable
+from risk_rules import flag_risk
 from visualization import hf_bar_figure, ltv_bar_figure, price_change_figure
+from session_store import PORTFOLIO_STORE_SPILL_DIR, PortfolioStore
+import metrics
+from metrics import timed
+
+logger = logging.getLogger(__name__)
+
+# Reserve data is served from a TTL cache: workers start from the last good
+# on-disk snapshot and refresh from The Graph in the background. Nothing is
+# loaded at import; the first request (or warm_up) does it. With
+# RESERVE_SHM_DIR set, all workers map the table published by one
+# `python shared_reserves.py` refresher instead.
+reserve_cache = SharedReserveTable() if RESERVE_SHM_DIR else ReserveCache()
+
+
+def get_coins():
+    return reserve_cache.get()
+
+
+def get_coin_list():
+    return get_coins()["symbol"].tolist()
+
+
+def get_coin_index():
+    """Coin search index, rebuilt only when the reserve table version changes."""
+    get_coins()
+    return coin_index(reserve_cache.version, get_coin_list)
+
+
+def warm_up():
+    """
+    Load the reserve table ahead of the first request. Called once in the
+    gunicorn master (see gunicorn.conf.py) so workers fork with it already in
+    memory. Returns the time taken in seconds.
+    """
+    started = time.perf_counter()
+    get_coins()
+    seconds = time.perf_counter() - started
+    metrics.histogram("app_startup_duration_seconds", "App import and warm-up time").labels(
+        phase="warm_up").observe(seconds)
+    return seconds
+
+
+# Stress runs execute as Dash background callbacks: a subprocess per job with
+# progress, cancellation and cached results in a local diskcache. Without the
+# diskcache extras (pip install "dash[diskcache]") or with STRESS_BACKGROUND=0
+# they run inside the request.
+BACKGROUND_CACHE_DIR = os.environ.get("BACKGROUND_CACHE_DIR", "cache")
+BACKGROUND_RESULT_TTL = int(os.environ.get("BACKGROUND_RESULT_TTL", 3600))
+
+
+def reserve_fingerprint():
+    """Identifies the current reserve table the same way in every worker."""
+    get_coins()
+    return reserve_cache.fingerprint
+
+
+background_manager = None
+if os.environ.get("STRESS_BACKGROUND", "1") != "0":
+    try:
+        import diskcache
+        from dash import DiskcacheManager
+
+        class StressResultManager(DiskcacheManager):
+            """Serves a cached stress result only while the portfolio handle it returns still resolves."""
+
+            def get_result(self, key, job):
+                result = self.handle.get(key, self.UNDEFINED)
+                refs = [v for v in result if isinstance(v, dict) and "handle" in v] \
+                    if isinstance(result, (list, tuple)) else []
+                if any(portfolio_store.get(ref["handle"]) is None for ref in refs):
+                    # The job started for this request recomputes it and overwrites the entry
+                    return self.UNDEFINED
+                return super().get_result(key, job)
+
+        background_manager = StressResultManager(
+            diskcache.Cache(os.path.join(BACKGROUND_CACHE_DIR, "jobs")),
+            cache_by=[reserve_fingerprint],  # results are reused until reserves change
+            expire=BACKGROUND_RESULT_TTL,
+        )
+    except ImportError:
+        pass
+
+# Portfolios stay on the server; dcc.Store(id="store-portfolio") only holds
+# {"handle": ...} pointing into this store. Handles are content hashes, so an
+# identical portfolio and sliders hit the background result cache. Entries
+# evicted from memory spill to a directory that all gunicorn workers and
+# background jobs share; stress results from background jobs are written
+# there at once, and with PORTFOLIO_STORE_WRITE_THROUGH=1 (set by
+# gunicorn.conf.py for several workers) every portfolio is.
+# PORTFOLIO_STORE_SPILL_DIR="" keeps them in process memory only, which is
+# only correct with a single worker and STRESS_BACKGROUND=0.
+portfolio_store = PortfolioStore(
+    spill_dir=os.path.join(BACKGROUND_CACHE_DIR, "portfolios") if PORTFOLIO_STORE_SPILL_DIR is None
+    else PORTFOLIO_STORE_SPILL_DIR
+)
 
 
+STRESS_STAGES = 4
 
-# Fetch default chain data at app start
-print("🔄 Fetching coin data from The Graph...")
-df_coins = get_reserves()
-print(f"✅ Loaded {len(df_coins)} coins")
 
-if len(df_coins) == 0:
-    print("❌ WARNING: No coins loaded! Check API connection.")
-    coin_list = []
-else:
-    coin_list = df_coins["symbol"].tolist()
-    print(f"📋 Coins available: {coin_list[:5]}... (showing first 5)")
+def report_stress_progress(stage):
+    """Advance the stress progress bar; a no-op outside a Dash callback (e.g. benchmarks)."""
+    try:
+        dash.set_props("stress-progress", {"value": str(stage), "max": str(STRESS_STAGES)})
+    except MissingCallbackContextException:
+        pass
 
 
 # Initialize app
 app = Dash(__name__, suppress_callback_exceptions=True)
 server = app.server
+metrics.install(server)  # GET /metrics
 
 
-def evaluate_row_risk(row, stressed_df):
-    """Returns True if this row contributes to risk after stress."""
-    symbol = row.get("Coin", "")
-    if not symbol:
-        return False
-
-    # Get price change
-    before = stressed_df.loc[stressed_df["symbol"] == symbol, "Price_before"].mean()
-    after = stressed_df.loc[stressed_df["symbol"] == symbol, "Price_after"].mean()
-
-    # Risk if price dropped more than -10%
-    if before > 0 and (after / before) < 0.90:
-        return True
-
-    return False
-
-print(f"🔍 DEBUG: coin_list has {len(coin_list)} items")
-print(f"First 10: {coin_list[:10] if coin_list else 'EMPTY!'}")
 
 
 # Layout
@@ -103,7 +187,7 @@ html.Div(
             data=[{"Coin": "", "Amount": "", "Risk": 0}],
             editable=True,
             row_deletable=True,
-            dropdown={},  # Will be populated by callback
+            dropdown={"Coin": {"options": []}},  # per-row options: table_coin_dropdowns
             style_table={
                 "overflowX": "auto",
             },
@@ -131,6 +215,12 @@ html.Div(
                 'rule': 'max-height: 300px !important;'
             }]        
             ),
+        dcc.Dropdown(
+            id={"type": "coin-search", "table": "deposits"},
+            placeholder="Search a coin to add...",
+            options=[],
+            style={"marginTop": "10px", "width": "300px"}
+        ),
         html.Button(
             "Add Row",
             id="add-deposit",
@@ -173,7 +263,7 @@ html.Div(
             data=[{"Coin": "", "Amount": "", "Risk": 0}],
             editable=True,
             row_deletable=True,
-            dropdown={},  # Will be populated by callback
+            dropdown={"Coin": {"options": []}},  # per-row options: table_coin_dropdowns
             style_table={
                 "overflowX": "auto",
             },
@@ -201,6 +291,12 @@ html.Div(
                 'rule': 'max-height: 300px !important;'
             }]  
                 ),
+        dcc.Dropdown(
+            id={"type": "coin-search", "table": "borrows"},
+            placeholder="Search a coin to add...",
+            options=[],
+            style={"marginTop": "10px", "width": "300px"}
+        ),
         html.Button(
             "Add Row",
             id="add-borrow",
@@ -318,6 +414,7 @@ html.Button(
                 ),
 
                 html.Div(id="stress-sliders-container", style={"marginBottom": "20px"}),
+                html.Div(id="stress-preview", style={"marginBottom": "20px", "color": "#555"}),
 
                 html.Button(
                     "Run Stress Test",
@@ -337,6 +434,22 @@ html.Button(
                     }
                 ),
 
+                html.Button(
+                    "Cancel",
+                    id="cancel-stress",
+                    n_clicks=0,
+                    disabled=True,
+                    style={
+                        "padding": "10px 20px",
+                        "marginLeft": "10px",
+                        "borderRadius": "8px",
+                        "border": "1px solid #ccc",
+                        "fontSize": "16px"
+                    }
+                ),
+                html.Progress(id="stress-progress", value="0", max=str(STRESS_STAGES),
+                              style={"marginLeft": "15px", "visibility": "hidden"}),
+
                 html.Br(), html.Br(),
                 html.Div(id="stress-results", style={"fontSize": "16px"}),
                 html.Div(
@@ -383,70 +496,79 @@ html.Div(
     ]
 ),
 
-        dcc.Store(id="store-portfolio")
+        dcc.Store(id="store-portfolio"),
+        dcc.Store(id="store-stress-surface")
     ]
 )
 
 # -------------------- Callbacks --------------------
 
 
-# Add this NEW callback to initialize dropdowns on page load
+# Coin search: options come from the server-side index, only matches are sent
 @app.callback(
-    Output("table-deposits", "dropdown"),
-    Output("table-borrows", "dropdown"),
-    Input("table-deposits", "id"),  # Dummy input to trigger on load
-    Input("table-borrows", "id")     # Dummy input to trigger on load
+    Output({"type": "coin-search", "table": MATCH}, "options"),
+    Input({"type": "coin-search", "table": MATCH}, "search_value"),
+    State({"type": "coin-search", "table": MATCH}, "value"),
 )
-def initialize_dropdowns(_, __):
-    """Populate dropdowns when page loads"""
-    dropdown_config = {
-        "Coin": {
-            "options": [{"label": c, "value": c} for c in coin_list]
-        }
-    }
-    print(f"🔄 Initializing dropdowns with {len(coin_list)} coins")
-    return dropdown_config, dropdown_config
+@timed("dash_callback_duration_seconds", callback="search_coins")
+def search_coins(search_value, selected):
+    return get_coin_index().search_options(search_value, keep=[selected] if selected else ())
+
+
+# Each row's Coin dropdown only lists that row's coin; new coins come from the search box
+@app.callback(
+    Output("table-deposits", "dropdown_data"),
+    Output("table-borrows", "dropdown_data"),
+    Input("table-deposits", "data"),
+    Input("table-borrows", "data"),
+)
+@timed("dash_callback_duration_seconds", callback="table_coin_dropdowns")
+def table_coin_dropdowns(deposits, borrows):
+    def row_options(rows):
+        return [{"Coin": {"options": [{"label": r["Coin"], "value": r["Coin"]}] if r.get("Coin") else []}}
+                for r in rows or []]
+    return row_options(deposits), row_options(borrows)
+
+def add_table_row(rows, columns, coin):
+    """Append a row for `coin`, or fill in the last row when it has no coin yet."""
+    if coin and rows and not rows[-1].get("Coin"):
+        rows[-1]["Coin"] = coin
+    else:
+        rows.append({c["id"]: (0 if c["id"] == "Risk" else "") for c in columns} | {"Coin": coin or ""})
+
 
 # Add row callbacks
 @app.callback(
     Output("table-deposits","data", allow_duplicate=True),
-    Output("table-deposits","dropdown", allow_duplicate=True),
+    Output({"type": "coin-search", "table": "deposits"}, "value"),
     Input("add-deposit","n_clicks"),
     State("table-deposits","data"),
     State("table-deposits","columns"),
+    State({"type": "coin-search", "table": "deposits"}, "value"),
     prevent_initial_call=True
 )
-def add_deposit_row(n, rows, columns):
+@timed("dash_callback_duration_seconds", callback="add_deposit_row")
+def add_deposit_row(n, rows, columns, coin=None):
     if n and rows is not None:
-        rows.append({c["id"]: (0 if c["id"] == "Risk" else "") for c in columns})
-    
-    # Always return the dropdown with fresh data
-    dropdown = {
-        "Coin": {
-            "options": [{"label": c, "value": c} for c in coin_list]
-        }
-    }
-    return rows, dropdown
+        add_table_row(rows, columns, coin)
+    # Clear the search box so the next click does not add the same coin again
+    return rows, None
 
 @app.callback(
     Output("table-borrows","data", allow_duplicate=True),
-    Output("table-borrows","dropdown", allow_duplicate=True),
+    Output({"type": "coin-search", "table": "borrows"}, "value"),
     Input("add-borrow","n_clicks"),
     State("table-borrows","data"),
     State("table-borrows","columns"),
+    State({"type": "coin-search", "table": "borrows"}, "value"),
     prevent_initial_call=True
 )
-def add_borrow_row(n, rows, columns):
+@timed("dash_callback_duration_seconds", callback="add_borrow_row")
+def add_borrow_row(n, rows, columns, coin=None):
     if n and rows is not None:
-        rows.append({c["id"]: (0 if c["id"] == "Risk" else "") for c in columns})
-    
-    # Always return the dropdown with fresh data
-    dropdown = {
-        "Coin": {
-            "options": [{"label": c, "value": c} for c in coin_list]
-        }
-    }
-    return rows, dropdown
+        add_table_row(rows, columns, coin)
+    # Clear the search box so the next click does not add the same coin again
+    return rows, None
 
 @app.callback(
     Output("table-deposits","data"),
@@ -466,15 +588,17 @@ def reset_all(n):
     Output("stress-borrow-select","options"),
     Output("stress-supply-select","options"),
     Output("store-portfolio","data", allow_duplicate=True),
+    Output("store-stress-surface","data"),
     Input("btn-calc","n_clicks"),
     State("table-deposits","data"),
     State("table-borrows","data"),
     prevent_initial_call=True,
 )
 # NEW:
+@timed("dash_callback_duration_seconds", callback="calculate_portfolio")
 def calculate_portfolio(n, deposits, borrows):
     if n == 0 or not deposits or not borrows:
-        return "Enter deposits and borrows, then click Calculate.", [], [], {}
+        return "Enter deposits and borrows, then click Calculate.", [], [], {}, None
     
     df_dep = pd.DataFrame(deposits)
     df_dep["Type"] = "Deposit"
@@ -486,13 +610,15 @@ def calculate_portfolio(n, deposits, borrows):
     if "Coin" in df_total.columns:
         df_total.rename(columns={"Coin":"symbol"}, inplace=True)
     
-    # Merge with coin data
-    df_total = df_total.merge(df_coins, on="symbol", how="left")    
+    # Merge with coin data (only the columns the calculations use)
+    with timed("calculation_stage_duration_seconds", stage="merge_reserves"):
+        df_total = df_total.merge(get_coins()[["symbol", "Price", "liquidationThreshold"]], on="symbol", how="left")
     df_total["Amount"] = pd.to_numeric(df_total["Amount"], errors="coerce").fillna(0)
     df_total["Price"] = pd.to_numeric(df_total["Price"], errors="coerce").fillna(0)
     df_total["liquidationThreshold"] = pd.to_numeric(df_total["liquidationThreshold"], errors="coerce").fillna(0)
     
-    df_total = general_calc(df_total)
+    with timed("calculation_stage_duration_seconds", stage="general_calc"):
+        df_total = general_calc(df_total)
     if "Risk" not in df_total.columns:
         df_total["Risk"] = 0
     else:
@@ -500,14 +626,81 @@ def calculate_portfolio(n, deposits, borrows):
         df_total["Risk"] = pd.to_numeric(df_total["Risk"].replace("", pd.NA), errors="coerce").fillna(0).astype(int)
 
     
-    hf = calculate_hf(df_total)
-    ltv = calculate_ltv(df_total)
+    with timed("calculation_stage_duration_seconds", stage="hf_ltv"):
+        hf = calculate_hf(df_total)
+        ltv = calculate_ltv(df_total)
     hf_text = hf_ratio_description(hf)
     
     borrow_options = [{"label":c,"value":c} for c in df_total.loc[df_total["Type"]=="Borrow","symbol"].unique()]
     supply_options = [{"label":c,"value":c} for c in df_total.loc[df_total["Type"]=="Deposit","symbol"].unique()]
     
-    return [html.P(hf_text), html.P(f"LTV: {round(ltv,2)}")], borrow_options, supply_options, df_total.to_dict(orient="records")
+    with timed("calculation_stage_duration_seconds", stage="stress_surface"):
+        surface = stress_response_surface(df_total)
+    # Blank table rows and coins without a reserve have no price to solve for
+    # or to move, so they stay out of the per-coin tables
+    df_known = df_total[df_total["symbol"].isin(get_coins()["symbol"])]
+    with timed("calculation_stage_duration_seconds", stage="liquidation_prices"):
+        liquidation_table = liquidation_price_table(liquidation_prices(df_known))
+    with timed("calculation_stage_duration_seconds", stage="sensitivities"):
+        risk_ranking = sensitivity_table(price_sensitivities(df_known))
+
+    # Content handle, shared by identical portfolios: left to the store's LRU
+    # instead of being discarded
+    handle = portfolio_store.put(df_total, portfolio_store.content_handle(df_total))
+
+    return [html.P(hf_text), html.P(f"LTV: {round(ltv,2)}"), liquidation_table, risk_ranking], borrow_options, supply_options, {"handle": handle}, surface
+
+
+def liquidation_price_table(df_liq):
+    """Break-even price per coin: where HF hits 1 if only that coin's price moves."""
+    rows = [
+        {
+            "Coin": rec["symbol"],
+            "Side": rec["Side"],
+            "Price": round(rec["Price"], 6),
+            "Liquidation Price": "—" if pd.isna(rec["Liquidation_Price"]) else round(rec["Liquidation_Price"], 6),
+            "Distance (%)": "—" if pd.isna(rec["Distance_Pct"]) else rec["Distance_Pct"],
+        }
+        for rec in df_liq.to_dict(orient="records")
+    ]
+    return html.Div([
+        html.H4("Liquidation Prices", style={"marginBottom": "8px"}),
+        dash_table.DataTable(
+            columns=[{"name": c, "id": c} for c in ["Coin", "Side", "Price", "Liquidation Price", "Distance (%)"]],
+            data=rows,
+            style_cell={"textAlign": "left", "padding": "8px", "fontSize": "14px"},
+            style_header={"fontWeight": "bold", "backgroundColor": "#f8f9fa"},
+        ),
+    ])
+
+def sensitivity_table(df_sens):
+    """Assets ranked by how much a 1% price move changes HF (exact, from price_sensitivities)."""
+    def fmt(value, digits):
+        return "—" if pd.isna(value) else round(float(value), digits)
+
+    rows = [
+        {
+            "Coin": symbol,
+            "Side": rec["Side"],
+            "HF change per +1%": fmt(rec["HF_per_pct"], 4),
+            "LTV change per +1%": fmt(rec["LTV_per_pct"], 4),
+            "Share of risk (%)": fmt(rec["Risk_Share"] * 100, 1),
+        }
+        for symbol, rec in df_sens.iterrows()
+    ]
+    columns = ["Coin", "Side", "HF change per +1%", "LTV change per +1%", "Share of risk (%)"]
+    return html.Div([
+        html.H4("Price Sensitivity", style={"marginBottom": "8px", "marginTop": "20px"}),
+        html.P("HF moves by about (HF change per +1%) × (price move in %) for small moves; "
+               "a falling deposit price or a rising borrow price lowers HF.",
+               style={"color": "#555", "fontSize": "14px"}),
+        dash_table.DataTable(
+            columns=[{"name": c, "id": c} for c in columns],
+            data=rows,
+            style_cell={"textAlign": "left", "padding": "8px", "fontSize": "14px"},
+            style_header={"fontWeight": "bold", "backgroundColor": "#f8f9fa"},
+        ),
+    ])
 
 # Generate sliders dynamically
 @app.callback(
@@ -515,6 +708,7 @@ def calculate_portfolio(n, deposits, borrows):
     Input("stress-borrow-select","value"),
     Input("stress-supply-select","value")
 )
+@timed("dash_callback_duration_seconds", callback="create_sliders")
 def create_sliders(borrowed, supplied):
     sliders = []
 
@@ -537,6 +731,40 @@ def create_sliders(borrowed, supplied):
     return sliders if sliders else "Select coins to stress."
 
 
+# Live HF/LTV preview while sliders move, evaluated in the browser from the
+# surface of the stored portfolio, precomputed by calculate_portfolio and
+# refreshed by run_stress_visual (mirrors evaluate_stress_surface)
+app.clientside_callback(
+    """
+    function(values, ids, surface) {
+        if (!surface || !ids || ids.length === 0) {
+            return "";
+        }
+        const factors = {};
+        ids.forEach((id, i) => {
+            const coin = id.index.split("-").slice(1).join("-");
+            const factor = factors[coin] === undefined ? 1 : factors[coin];
+            factors[coin] = factor * (1 - (values[i] || 0) / 100);
+        });
+        let collateralAdjusted = 0, collateral = 0, debt = 0;
+        surface.symbols.forEach((symbol, i) => {
+            const factor = factors[symbol] === undefined ? 1 : factors[symbol];
+            collateralAdjusted += surface.collateral_adjusted[i] * factor;
+            collateral += surface.collateral[i] * factor;
+            debt += surface.debt[i] * factor;
+        });
+        const hf = debt === 0 ? "∞" : (collateralAdjusted / debt).toFixed(3);
+        const ltv = collateral === 0 ? "n/a" : (debt / collateral).toFixed(2);
+        return `Preview — HF: ${hf}, LTV: ${ltv}`;
+    }
+    """,
+    Output("stress-preview", "children"),
+    Input({"type": "stress-slider", "index": ALL}, "value"),
+    Input({"type": "stress-slider", "index": ALL}, "id"),
+    Input("store-stress-surface", "data"),
+)
+
+
 
 # Run stress test and update visualizations
 # Run stress test and update visualizations
@@ -549,54 +777,59 @@ def create_sliders(borrowed, supplied):
     Output("table-deposits", "data", allow_duplicate=True),
     Output("table-borrows", "data", allow_duplicate=True),
     Output("store-portfolio", "data", allow_duplicate=True),
+    Output("store-stress-surface", "data", allow_duplicate=True),
     Input("run-stress", "n_clicks"),
     State({"type": "stress-slider", "index": ALL}, "value"),
     State({"type": "stress-slider", "index": ALL}, "id"),
     State("store-portfolio", "data"),
-    prevent_initial_call=True
+    prevent_initial_call=True,
+    **({} if background_manager is None else dict(
+        background=True,
+        manager=background_manager,
+        running=[
+            (Output("run-stress", "disabled"), True, False),
+            (Output("cancel-stress", "disabled"), False, True),
+            (Output("stress-progress", "style"),
+             {"marginLeft": "15px", "visibility": "visible"}, {"marginLeft": "15px", "visibility": "hidden"}),
+        ],
+        cancel=[Input("cancel-stress", "n_clicks")],
+        cache_args_to_ignore=[0],  # n_clicks: same portfolio + sliders reuse the cached result
+    ))
 )
 
-def run_stress_visual(n, values, ids, portfolio_data):
+@timed("dash_callback_duration_seconds", callback="run_stress_visual")
+def run_stress_visual(n, values, ids, portfolio_ref):
     if n == 0:
-        return "", {}, {}, {}, dash.no_update, dash.no_update, dash.no_update
-    if not portfolio_data:
-        return "No portfolio data stored. Calculate first.", {}, {}, {}, dash.no_update, dash.no_update, dash.no_update
+        return "", {}, {}, {}, dash.no_update, dash.no_update, dash.no_update, dash.no_update
+    if not portfolio_ref:
+        return "No portfolio data stored. Calculate first.", {}, {}, {}, dash.no_update, dash.no_update, dash.no_update, dash.no_update
+
+    # DataFrame from the server-side store
+    df = portfolio_store.get(portfolio_ref.get("handle"))
+    if df is None:
+        return "Stored portfolio expired. Calculate again.", {}, {}, {}, dash.no_update, dash.no_update, dash.no_update, dash.no_update
 
     # Create stress input dictionary
     stress_inputs = {f"{id_['index']}": val for id_, val in zip(ids, values)}
 
-    # DataFrame from stored portfolio
-    df = pd.DataFrame(portfolio_data)
-
     # Run stress test - THIS CREATES stressed_df
-    stressed_df, prices = stress_test_calculation_multiple(df, stress_inputs)
+    with timed("calculation_stage_duration_seconds", stage="stress_test"):
+        stressed_df, prices = stress_test_calculation_multiple(df, stress_inputs)
+    report_stress_progress(1)
 
     # --- Calculate metrics before & after ---
-    hf_before = calculate_hf(df)
-    hf_after = calculate_hf(stressed_df)
-    ltv_before = calculate_ltv(df)
-    ltv_after = calculate_ltv(stressed_df)
-
-    # --- Risk evaluation function ---
-    def eval_risk_row(record, prices_map, hf_after_val):
-        sym = record.get("symbol", "")
-        if not sym:
-            return 0
-        # Flag as risky if HF < 1
-        if hf_after_val is not None and hf_after_val < 1.0:
-            return 1
-        # Flag as risky if price dropped > 10%
-        p = prices_map.get(sym)
-        if p and p["old"] > 0 and (p["new"] / p["old"]) < 0.90:
-            return 1
-        return 0
-
-    # Now stressed_df is available from above
+    with timed("calculation_stage_duration_seconds", stage="hf_ltv"):
+        hf_before = calculate_hf(df)
+        hf_after = calculate_hf(stressed_df)
+        ltv_before = calculate_ltv(df)
+        ltv_after = calculate_ltv(stressed_df)
+    report_stress_progress(2)
+
+    # Risk flags (risk_rules.DEFAULT_RULES), one vectorized pass over the table
     stressed_records = stressed_df.copy()
-    # Ensure Risk column exists and is properly typed
-    stressed_records["Risk"] = stressed_records.apply(
-        lambda r: eval_risk_row(r, prices, hf_after), axis=1
-    )
+    with timed("calculation_stage_duration_seconds", stage="risk_flags"):
+        stressed_records["Risk"] = flag_risk(stressed_df, df["Price"]).astype(int)
+    report_stress_progress(3)
 
     # Prepare DataTables with consistent column naming
     table_records = stressed_records.to_dict(orient="records")
@@ -629,14 +862,35 @@ def run_stress_visual(n, values, ids, portfolio_data):
     ]
 
     # --- Visuals ---
-    hf_bar = hf_bar_figure(hf_before, hf_after)
-    ltv_bar = ltv_bar_figure(ltv_before, ltv_after)
-    price_chart = price_change_figure(df, stressed_df)
+    with timed("calculation_stage_duration_seconds", stage="figures"):
+        hf_bar = hf_bar_figure(hf_before, hf_after)
+        ltv_bar = ltv_bar_figure(ltv_before, ltv_after)
+        price_chart = price_change_figure(df, stressed_df)
+
+    report_stress_progress(4)
+
+    # A background job runs in its own process: the worker polling for the
+    # result reads the stressed portfolio from the spill directory
+    handle = portfolio_store.put(stressed_records, portfolio_store.content_handle(stressed_records),
+                                 persist=True if background_manager else None)
+
+    # The stored portfolio is now the stressed one and the next run compounds
+    # on it, so the slider preview must read the same portfolio
+    with timed("calculation_stage_duration_seconds", stage="stress_surface"):
+        surface = stress_response_surface(stressed_df)
+
+    return results, hf_bar, ltv_bar, price_chart, deposits_table, borrows_table, {"handle": handle}, surface
+
+
+import_seconds = time.perf_counter() - _import_started
+metrics.histogram("app_startup_duration_seconds", "App import and warm-up time").labels(
+    phase="import").observe(import_seconds)
+logger.info("app imported in %.2fs", import_seconds)
 
-    return results, hf_bar, ltv_bar, price_chart, deposits_table, borrows_table, stressed_records.to_dict(orient="records")
 # Run server
 if __name__ == "__main__":
-    app.run_server(debug=True)
+    logging.basicConfig(level=logging.INFO)
+    app.run(debug=True)
 
 
 
@@ -0,0 +1,134 @@
+# ------------------------- batch_risk.py -------------------------
+# Headless, chunked batch risk over large position files.
+#
+#   python batch_risk.py positions.parquet --out risk.parquet \
+#       --reserves reserves_snapshot.parquet --scenario eth_crash:WETH=30,WBTC=20
+#
+# Positions (CSV or Parquet) need account, symbol, Type ("Deposit"/"Borrow")
+# and Amount columns, plus chain when the reserve snapshot has one, and must be
+# grouped by account: rows of one account may span chunk boundaries but not be
+# spread across the file. Each chunk is joined with the reserve snapshot, run
+# through calculate_batch_metrics for the current prices and every scenario
+# (plus the number of positions flagged by risk_rules), and appended to the
+# output Parquet file, so memory stays bounded by the chunk size.
+import argparse
+import os
+import sys
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from calculations import calculate_batch_metrics, stress_price_factors
+from fetch_data import RESERVE_SNAPSHOT_PATH
+from positions import reserve_keys
+from risk_rules import flag_risk
+
+POSITION_COLUMNS = ["symbol", "Type", "Amount"]
+
+
+def read_reserves(path):
+    df = pd.read_parquet(path) if path.endswith(".parquet") else pd.read_csv(path)
+    keys = ["chain", "symbol"] if "chain" in df.columns else ["symbol"]
+    return df[keys + ["Price", "liquidationThreshold"]].drop_duplicates(keys)
+
+
+def read_position_chunks(path, chunk_size, columns=None):
+    """Yield DataFrames of at most `chunk_size` rows from a CSV or Parquet file."""
+    if path.endswith(".parquet"):
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size, columns=columns):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunk_size, usecols=columns)
+
+
+def whole_accounts(chunks, account_col):
+    """Re-cut chunks so no account is split: the last account of a chunk moves to the next one."""
+    carry = None
+    for chunk in chunks:
+        if carry is not None:
+            chunk = pd.concat([carry, chunk], ignore_index=True)
+        if chunk.empty:
+            continue
+        last = chunk[account_col].iloc[-1]
+        tail = (chunk[account_col] == last).to_numpy()
+        carry = chunk[tail]
+        if (~tail).any():
+            yield chunk[~tail]
+    if carry is not None and not carry.empty:
+        yield carry
+
+
+def parse_scenario(text):
+    """
+    "name:SYM=pct,SYM=pct" -> (name, {"scenario-SYM": pct}), pct being a price drop in %.
+    With a chain column in the reserves, SYM is chain:SYM (only the symbol is upper-cased).
+    """
+    name, _, shocks = text.partition(":")
+    stress_inputs = {}
+    for shock in filter(None, shocks.split(",")):
+        symbol, _, pct = shock.partition("=")
+        chain, separator, symbol = symbol.strip().rpartition(":")
+        stress_inputs[f"scenario-{chain}{separator}{symbol.upper()}"] = float(pct)
+    return name, stress_inputs
+
+
+def risk_chunks(chunks, reserves, scenarios, account_col="account"):
+    """HF, LTV and totals per account for every chunk, plus HF/LTV for each scenario."""
+    keys = ["chain", "symbol"] if "chain" in reserves.columns else ["symbol"]
+    for chunk in chunks:
+        chunk["symbol"] = chunk["symbol"].astype(str).str.upper()
+        positions = chunk.merge(reserves, on=keys, how="left")
+        result = calculate_batch_metrics(positions, account_col)
+        base_price = positions["Price"]
+        for name, stress_inputs in scenarios:
+            factors = pd.Series({coin: float(f) for coin, f in stress_price_factors(stress_inputs).items()})
+            positions["Price"] = base_price * reserve_keys(positions).map(factors).fillna(1.0)
+            stressed = calculate_batch_metrics(positions, account_col)
+            result[f"HF_{name}"] = stressed["HF"]
+            result[f"LTV_{name}"] = stressed["LTV"]
+            flags = pd.Series(flag_risk(positions, base_price, account_col), index=positions.index)
+            result[f"Risk_Flags_{name}"] = flags.groupby(positions[account_col]).sum().reindex(result.index)
+        yield result.reset_index()
+
+
+def write_parquet(frames, path):
+    """Stream DataFrames into one Parquet file; returns the number of rows written."""
+    writer, rows = None, 0
+    try:
+        for frame in frames:
+            table = pa.Table.from_pandas(frame, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(path, table.schema)
+            writer.write_table(table.cast(writer.schema))
+            rows += len(frame)
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Chunked HF/LTV and stress scenarios over a positions file.")
+    parser.add_argument("positions", help="CSV or Parquet positions file, grouped by account")
+    parser.add_argument("--out", required=True, help="output Parquet file")
+    parser.add_argument("--reserves", default=RESERVE_SNAPSHOT_PATH, help="reserve snapshot (Parquet or CSV)")
+    parser.add_argument("--scenario", action="append", default=[], type=parse_scenario,
+                        help='price drop scenario "name:SYM=pct,SYM=pct" (repeatable)')
+    parser.add_argument("--account-col", default="account")
+    parser.add_argument("--chunk-size", type=int, default=250_000)
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.reserves):
+        parser.error(f"reserve snapshot {args.reserves} not found")
+    reserves = read_reserves(args.reserves)
+    columns = [args.account_col] + POSITION_COLUMNS + (["chain"] if "chain" in reserves.columns else [])
+
+    chunks = whole_accounts(read_position_chunks(args.positions, args.chunk_size, columns), args.account_col)
+    rows = write_parquet(risk_chunks(chunks, reserves, args.scenario, args.account_col), args.out)
+    print(f"Wrote {rows} accounts to {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
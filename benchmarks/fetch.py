@@ -0,0 +1,61 @@
+# ------------------------- benchmarks/fetch.py -------------------------
+# Reserve fetch and app startup timings against the local GraphQL stand-in.
+#
+#   python -m benchmarks.fetch --markets 500 5000 --latency-ms 0 50
+#   python -m benchmarks.fetch --cassette-dir cassettes --startup
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+from benchmarks.graphql_standin import load_recorded_markets, start_standin, synthetic_markets
+
+
+def time_get_reserves(url, repeats):
+    from fetch_data import SubgraphClient, get_reserves
+    client = SubgraphClient(url)
+    durations = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        df = get_reserves(client)
+        durations.append(time.perf_counter() - start)
+    return len(df), min(durations), sum(durations) / len(durations), client.timing_stats()
+
+
+def time_app_startup(url):
+    """Wall time of `import app` plus warm_up() in a fresh interpreter, fetching from `url` with no snapshot."""
+    env = {**os.environ, "SUBGRAPH_URL": url, "SUBGRAPH_MODE": "live", "RESERVE_SNAPSHOT_PATH": ""}
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "import app; app.warm_up()"], env=env, check=True, stdout=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time get_reserves and app startup against a local stand-in.")
+    parser.add_argument("--cassette-dir", default="cassettes")
+    parser.add_argument("--markets", type=int, nargs="+", default=[500, 5000])
+    parser.add_argument("--latency-ms", type=float, nargs="+", default=[0.0, 50.0])
+    parser.add_argument("--pad-bytes", type=int, default=0)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--startup", action="store_true", help="also time app import + warm-up in a subprocess")
+    args = parser.parse_args(argv)
+
+    recorded = load_recorded_markets(args.cassette_dir) if os.path.isdir(args.cassette_dir) else []
+    print(f"{'markets':>8}{'latency ms':>12}{'best s':>10}{'mean s':>10}{'req p50 ms':>12}"
+          f"{'req p95 ms':>12}{'startup s':>11}")
+    for n_markets in args.markets:
+        for latency_ms in args.latency_ms:
+            server = start_standin(synthetic_markets(n_markets, recorded), latency=latency_ms / 1000,
+                                   pad_bytes=args.pad_bytes)
+            try:
+                rows, best, mean, stats = time_get_reserves(server.url, args.repeats)
+                startup = f"{time_app_startup(server.url):>11.2f}" if args.startup else ""
+            finally:
+                server.shutdown()
+            print(f"{rows:>8}{latency_ms:>12.0f}{best:>10.3f}{mean:>10.3f}{stats['p50_ms']:>12.1f}"
+                  f"{stats['p95_ms']:>12.1f}{startup}")
+
+
+if __name__ == "__main__":
+    main()
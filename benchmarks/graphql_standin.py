@@ -0,0 +1,142 @@
+# ------------------------- benchmarks/graphql_standin.py -------------------------
+# Local stand-in for the subgraph gateway, serving recorded `markets` responses.
+#
+#   SUBGRAPH_MODE=record python app.py            # record real responses to ./cassettes
+#   python -m benchmarks.graphql_standin --cassette-dir cassettes --latency-ms 80 --markets 5000
+#   SUBGRAPH_URL=http://127.0.0.1:8000/ python app.py
+#
+# Answers `markets` queries with `first` / `id_gt` pagination like the real
+# subgraph (full rows, the field projection is not applied). Latency, jitter,
+# the number of markets and per-row padding are configurable so the fetch path
+# and app startup can be measured under controlled conditions.
+import argparse
+import glob
+import json
+import os
+import random
+import re
+import threading
+import time
+from bisect import bisect_right
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def load_recorded_markets(cassette_dir):
+    """Every `markets` row found in the recorded responses of `cassette_dir`, unique by id."""
+    markets = {}
+    for path in glob.glob(os.path.join(cassette_dir, "*.json")):
+        with open(path) as f:
+            response = json.load(f).get("response", {})
+        for market in (response.get("data") or {}).get("markets", []):
+            markets[market.get("id") or json.dumps(market, sort_keys=True)] = market
+    return list(markets.values())
+
+
+def synthetic_markets(n_markets, templates=None, seed=0):
+    """`n_markets` rows, cycling over recorded `templates` (or made up) with unique ids and symbols."""
+    rng = random.Random(seed)
+    rows = []
+    for i in range(n_markets):
+        if templates:
+            row = json.loads(json.dumps(templates[i % len(templates)]))
+            if i >= len(templates):
+                row["inputToken"]["symbol"] = f"{row['inputToken']['symbol']}{i // len(templates)}"
+        else:
+            row = {
+                "inputToken": {"symbol": f"SYM{i}", "lastPriceUSD": str(rng.lognormvariate(3, 2))},
+                "totalDepositBalanceUSD": str(rng.uniform(1e6, 1e9)),
+                "totalBorrowBalanceUSD": str(rng.uniform(1e5, 1e8)),
+                "liquidationThreshold": str(rng.uniform(0.5, 0.9)),
+            }
+        row["id"] = f"0x{i:040x}"
+        rows.append(row)
+    return rows
+
+
+class StandinServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, markets, latency=0.0, jitter=0.0, pad_bytes=0):
+        super().__init__(address, _Handler)
+        if pad_bytes:
+            markets = [{**m, "_padding": "x" * pad_bytes} for m in markets]
+        self.markets = sorted(markets, key=lambda m: m["id"])
+        self.ids = [m["id"] for m in self.markets]
+        self.latency = latency
+        self.jitter = jitter
+        self.requests_served = 0
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, so the client's connection pool is exercised
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        server = self.server
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        except ValueError:
+            return self._send(400, {"errors": [{"message": "invalid JSON body"}]})
+
+        query = body.get("query", "")
+        variables = body.get("variables") or {}
+        first = variables.get("first")
+        if first is None:
+            match = re.search(r"first:\s*(\d+)", query)
+            first = int(match.group(1)) if match else 100
+        last_id = variables.get("lastId", "")
+        start = bisect_right(server.ids, last_id) if last_id else 0
+
+        delay = server.latency + random.uniform(0, server.jitter)
+        if delay:
+            time.sleep(delay)
+        server.requests_served += 1
+        self._send(200, {"data": {"markets": server.markets[start:start + first]}})
+
+    def _send(self, status, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def start_standin(markets, host="127.0.0.1", port=0, latency=0.0, jitter=0.0, pad_bytes=0):
+    """Start a stand-in server on a background thread and return it (see StandinServer.url)."""
+    server = StandinServer((host, port), markets, latency, jitter, pad_bytes)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve recorded subgraph `markets` responses locally.")
+    parser.add_argument("--cassette-dir", default="cassettes", help="recordings from SUBGRAPH_MODE=record")
+    parser.add_argument("--markets", type=int, help="serve this many markets (recorded rows are cycled)")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--pad-bytes", type=int, default=0, help="extra payload bytes per market row")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args(argv)
+
+    recorded = load_recorded_markets(args.cassette_dir) if os.path.isdir(args.cassette_dir) else []
+    markets = synthetic_markets(args.markets or len(recorded) or 100, recorded)
+    server = StandinServer((args.host, args.port), markets, args.latency_ms / 1000, args.jitter_ms / 1000,
+                           args.pad_bytes)
+    print(f"Serving {len(markets)} markets on {server.url} ({len(recorded)} recorded)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
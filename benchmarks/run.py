@@ -0,0 +1,203 @@
+# ------------------------- benchmarks/run.py -------------------------
+# Benchmarks for the calculation, stress and Dash callback paths.
+#
+#   python -m benchmarks.run                      # 10 .. 10^6 positions
+#   python -m benchmarks.run --sizes 1000 100000  # selected sizes
+#   python -m benchmarks.run --update-baseline    # record new baseline
+#
+# Reports best-of-N wall time, throughput (positions/s) and peak traced
+# memory per case and size. Each timing is compared with benchmarks/baseline.json
+# and the run exits non-zero when a case is slower than `tolerance` x baseline
+# (differences under `noise_floor` seconds are ignored).
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+from benchmarks.synthetic import merged_positions, synthetic_positions, synthetic_reserves, table_records
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+DEFAULT_SIZES = [10, 100, 1_000, 10_000, 100_000, 1_000_000]
+CALLBACK_MAX_SIZE = 100_000  # the Dash callbacks go through JSON-like records
+
+
+def load_app(reserves):
+    """Import app.py with get_reserves stubbed, no reserve snapshot, in-memory portfolios and in-request stress runs."""
+    os.environ["RESERVE_SNAPSHOT_PATH"] = ""
+    os.environ["PORTFOLIO_STORE_SPILL_DIR"] = ""
+    os.environ["STRESS_BACKGROUND"] = "0"
+    import fetch_data
+    fetch_data.get_reserves = lambda *args, **kwargs: reserves
+    with contextlib.redirect_stdout(io.StringIO()):
+        import app
+    return app
+
+
+def _stress_inputs(df):
+    held = df["symbol"].drop_duplicates().tolist()[:3]
+    return {f"supply-{c}": 25 for c in held}
+
+
+def case_general_calc(size, reserves):
+    from calculations import general_calc
+    df = merged_positions(size, reserves)
+    return lambda: general_calc(df)
+
+
+def case_calculate_hf(size, reserves):
+    from calculations import calculate_hf, general_calc
+    df = general_calc(merged_positions(size, reserves))
+    return lambda: calculate_hf(df)
+
+
+def case_calculate_ltv(size, reserves):
+    from calculations import calculate_ltv, general_calc
+    df = general_calc(merged_positions(size, reserves))
+    return lambda: calculate_ltv(df)
+
+
+def case_stress_test(size, reserves):
+    from calculations import general_calc, stress_test_calculation_multiple
+    df = general_calc(merged_positions(size, reserves))
+    stress_inputs = _stress_inputs(df)
+    return lambda: stress_test_calculation_multiple(df, stress_inputs)
+
+
+def case_batch_metrics(size, reserves):
+    from calculations import calculate_batch_metrics
+    df = merged_positions(size, reserves)
+    return lambda: calculate_batch_metrics(df)
+
+
+def case_liquidation_cascade(size, reserves):
+    from cascade import simulate_cascade
+    from positions import CompactPortfolio, ReserveTable
+    df = synthetic_positions(size, reserves)
+    portfolio = CompactPortfolio.from_frame(df, ReserveTable.from_frame(reserves), "account")
+    stress_inputs = _stress_inputs(df)
+    return lambda: simulate_cascade(portfolio, stress_inputs)
+
+
+def case_callback_calculate_portfolio(size, reserves):
+    app = load_app(reserves)
+    deposits, borrows = table_records(synthetic_positions(size, reserves))
+
+    def run():
+        ref = app.calculate_portfolio(1, deposits, borrows)[3]
+        app.portfolio_store.discard(ref.get("handle"))
+    return run
+
+
+def case_callback_run_stress_visual(size, reserves):
+    app = load_app(reserves)
+    deposits, borrows = table_records(synthetic_positions(size, reserves))
+    state = {"ref": app.calculate_portfolio(1, deposits, borrows)[3]}
+    stress_inputs = _stress_inputs(synthetic_positions(size, reserves))
+    ids = [{"type": "stress-slider", "index": key} for key in stress_inputs]
+    values = list(stress_inputs.values())
+
+    def run():
+        state["ref"] = app.run_stress_visual(1, values, ids, state["ref"])[6]
+    return run
+
+
+CASES = {
+    "general_calc": (case_general_calc, None),
+    "calculate_hf": (case_calculate_hf, None),
+    "calculate_ltv": (case_calculate_ltv, None),
+    "stress_test_calculation_multiple": (case_stress_test, None),
+    "calculate_batch_metrics": (case_batch_metrics, None),
+    "liquidation_cascade": (case_liquidation_cascade, None),
+    "callback_calculate_portfolio": (case_callback_calculate_portfolio, CALLBACK_MAX_SIZE),
+    "callback_run_stress_visual": (case_callback_run_stress_visual, CALLBACK_MAX_SIZE),
+}
+
+
+def time_case(fn, min_time=0.2, max_repeats=5):
+    """Best wall time over repeats (at least one, stopping once `min_time` has elapsed)."""
+    best, total, repeats = float("inf"), 0.0, 0
+    while repeats < max_repeats and (repeats == 0 or total < min_time):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        best, total, repeats = min(best, elapsed), total + elapsed, repeats + 1
+    return best
+
+
+def peak_memory(fn):
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run(cases, sizes, n_assets=50):
+    reserves = synthetic_reserves(n_assets)
+    results = {}
+    for name in cases:
+        setup, max_size = CASES[name]
+        for size in sizes:
+            if max_size is not None and size > max_size:
+                continue
+            fn = setup(size, reserves)
+            fn()  # warm-up
+            seconds = time_case(fn)
+            results.setdefault(name, {})[str(size)] = {
+                "seconds": seconds,
+                "throughput": size / seconds if seconds > 0 else float("inf"),
+                "peak_mb": peak_memory(fn) / 1024 ** 2,
+            }
+            yield name, size, results[name][str(size)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark calculations, stress and callback paths.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--cases", nargs="+", choices=sorted(CASES), default=list(CASES))
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=1.5, help="allowed slowdown factor vs baseline")
+    parser.add_argument("--noise-floor", type=float, default=0.002,
+                        help="ignore slowdowns smaller than this many seconds")
+    args = parser.parse_args(argv)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    print(f"{'case':<34}{'positions':>10}{'seconds':>12}{'pos/s':>14}{'peak MB':>10}{'vs base':>9}")
+    collected, regressions = {}, []
+    for name, size, result in run(args.cases, args.sizes):
+        collected.setdefault(name, {})[str(size)] = result
+        base = baseline.get(name, {}).get(str(size))
+        ratio = result["seconds"] / base["seconds"] if base and base["seconds"] > 0 else None
+        flag = ""
+        if ratio is not None and ratio > args.tolerance and result["seconds"] - base["seconds"] > args.noise_floor:
+            regressions.append((name, size, ratio))
+            flag = " REGRESSION"
+        print(f"{name:<34}{size:>10}{result['seconds']:>12.5f}{result['throughput']:>14.0f}"
+              f"{result['peak_mb']:>10.1f}{'' if ratio is None else f'{ratio:>8.2f}x'}{flag}")
+
+    if args.update_baseline:
+        for name, sizes in collected.items():
+            baseline.setdefault(name, {}).update(sizes)
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if regressions:
+        print(f"{len(regressions)} regression(s) over {args.tolerance}x baseline", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
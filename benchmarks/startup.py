@@ -0,0 +1,74 @@
+# ------------------------- benchmarks/startup.py -------------------------
+# Import and boot time budget of the web app, each sample in a fresh interpreter.
+#
+#   python -m benchmarks.startup                       # report, exit 1 over budget
+#   python -m benchmarks.startup --import-budget 1.5 --warm-up-budget 1.0
+#
+# "import" is `import app` (no network, no reserve loading), "warm-up" is
+# app.warm_up() as run in the gunicorn master: loading the reserve table.
+# The slowest top-level imports from `python -X importtime` are listed too.
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+PROBE = """
+import json, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter() - started
+print(json.dumps({"import": imported, "warm_up": app.warm_up()}))
+"""
+
+
+def boot_times(env):
+    result = subprocess.run([sys.executable, "-c", PROBE], env=env, check=True, capture_output=True, text=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def slowest_imports(env, top=10):
+    """(module, cumulative seconds) of the slowest modules imported by `import app`."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app"], env=env, check=True,
+                            capture_output=True, text=True)
+    rows, children = [], []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 1:
+            children.append((name.strip(), int(cumulative) / 1e6))
+        elif depth == 0:
+            # importtime lists a module's imports before the module itself
+            if name.strip() == "app":
+                rows = children
+            children = []
+    return sorted(rows, key=lambda r: -r[1])[:top]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure app import and warm-up time against a budget.")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--import-budget", type=float, default=2.0, help="seconds for `import app`")
+    parser.add_argument("--warm-up-budget", type=float, default=1.5, help="seconds for app.warm_up()")
+    args = parser.parse_args(argv)
+
+    env = {**os.environ, "STRESS_BACKGROUND": os.environ.get("STRESS_BACKGROUND", "1")}
+    samples = [boot_times(env) for _ in range(args.repeats)]
+    over = False
+    print(f"{'phase':<10}{'best s':>10}{'worst s':>10}{'budget s':>10}")
+    for phase, budget in (("import", args.import_budget), ("warm_up", args.warm_up_budget)):
+        times = [s[phase] for s in samples]
+        flag = " OVER BUDGET" if min(times) > budget else ""
+        over |= bool(flag)
+        print(f"{phase:<10}{min(times):>10.3f}{max(times):>10.3f}{budget:>10.2f}{flag}")
+
+    print("\nslowest imports of app.py (cumulative s):")
+    for name, seconds in slowest_imports(env):
+        print(f"  {name:<30}{seconds:>8.3f}")
+    return 1 if over else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,41 @@
+# ------------------------- benchmarks/synthetic.py -------------------------
+# Deterministic synthetic reserves and positions, no network needed
+import numpy as np
+import pandas as pd
+
+
+def synthetic_reserves(n_assets=50, seed=0):
+    """Reserve table shaped like fetch_data.get_reserves."""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "symbol": [f"SYM{i}" for i in range(n_assets)],
+        "totalLiquidity": rng.uniform(1e6, 1e9, n_assets),
+        "totalBorrows": rng.uniform(1e5, 1e8, n_assets),
+        "liquidationThreshold": rng.uniform(0.5, 0.9, n_assets),
+        "Price": rng.lognormal(3, 2, n_assets),
+    })
+
+
+def synthetic_positions(n_positions, reserves, positions_per_account=4, deposit_share=0.6, seed=1):
+    """Long positions table: account, symbol, Type and Amount (not merged with reserves)."""
+    rng = np.random.default_rng(seed)
+    symbols = reserves["symbol"].to_numpy()
+    return pd.DataFrame({
+        "account": np.arange(n_positions) // positions_per_account,
+        "symbol": symbols[rng.integers(0, len(symbols), n_positions)],
+        "Type": np.where(rng.random(n_positions) < deposit_share, "Deposit", "Borrow"),
+        "Amount": rng.lognormal(2, 1.5, n_positions),
+    })
+
+
+def merged_positions(n_positions, reserves, **kwargs):
+    """Positions merged with the reserve columns, as the app does before general_calc."""
+    return synthetic_positions(n_positions, reserves, **kwargs).merge(reserves, on="symbol", how="left")
+
+
+def table_records(positions):
+    """Dash DataTable records ({"Coin", "Amount", "Risk"}) for deposits and borrows."""
+    records = positions.rename(columns={"symbol": "Coin"}).assign(Risk=0)[["Coin", "Amount", "Risk", "Type"]]
+    deposits = records[records["Type"] == "Deposit"].drop(columns="Type").to_dict(orient="records")
+    borrows = records[records["Type"] == "Borrow"].drop(columns="Type").to_dict(orient="records")
+    return deposits, borrows
@@ -3,6 +3,10 @@
 import pandas as pd
 import numpy as np
 
+from positions import CompactPortfolio, reserve_keys
+from risk_math import health_factor, loan_to_value, numeric_column
+from risk_rules import DEFAULT_RULES, evaluate_rules
+
 
 def general_calc(df_total):
     df_total["Price"] = pd.to_numeric(df_total["Price"], errors="coerce").fillna(0)
@@ -15,7 +19,26 @@ def general_calc(df_total):
     return df_total
 
 
+def _compact_totals(portfolio: CompactPortfolio, by_account=False):
+    """Collateral, adjusted collateral and debt of a CompactPortfolio, per account code or in total."""
+    value = portfolio.values()
+    is_deposit = ~portfolio.is_borrow
+    weights = (
+        np.where(is_deposit, value, 0.0),
+        np.where(is_deposit, value * portfolio.liquidation_threshold(), 0.0),
+        np.where(portfolio.is_borrow, value, 0.0),
+    )
+    if by_account:
+        return tuple(np.bincount(portfolio.account, weights=w, minlength=portfolio.n_accounts) for w in weights)
+    return tuple(w.sum() for w in weights)
+
+
 def calculate_hf(df_total: pd.DataFrame):
+    if isinstance(df_total, CompactPortfolio):
+        if len(df_total) == 0:
+            return None
+        _, adjusted, borrowed = _compact_totals(df_total)
+        return float('inf') if borrowed == 0 else round(float(adjusted / borrowed), 3)
     if df_total is None or df_total.empty:
         return None
     borrow_amount_total = df_total.loc[df_total['Type']=='Borrow','Total_Value'].sum()
@@ -40,6 +63,11 @@ def hf_ratio_description(health_factor):
 
 
 def calculate_ltv(df_total: pd.DataFrame):
+    if isinstance(df_total, CompactPortfolio):
+        if len(df_total) == 0:
+            return None
+        supplied, _, borrowed = _compact_totals(df_total)
+        return None if supplied == 0 else round(float(borrowed / supplied), 3)
     if df_total is None or df_total.empty:
         return None
     borrow_amount_total = df_total.loc[df_total['Type']=='Borrow','Total_Value'].sum()
@@ -49,13 +77,62 @@ def calculate_ltv(df_total: pd.DataFrame):
     return round(float(borrow_amount_total / supplied_total), 3)
 
 
+def calculate_batch_metrics(df_positions: pd.DataFrame, account_col="account"):
+    """
+    HF, LTV and totals for every account of a long positions table in one pass.
+    Expects one row per position with the account id, Type ("Deposit"/"Borrow"),
+    Amount, Price and liquidationThreshold. Per account the numbers match
+    calculate_hf / calculate_ltv: HF is inf without borrows, LTV is NaN
+    (None in the single-portfolio API) without deposits.
+    A CompactPortfolio is grouped by its own account codes.
+    """
+    if isinstance(df_positions, CompactPortfolio):
+        collateral, adjusted, debt = _compact_totals(df_positions, by_account=True)
+        return _metrics_frame(collateral, adjusted, debt, df_positions.accounts, account_col)
+
+    if df_positions is None or df_positions.empty:
+        return _metrics_frame(np.zeros(0), np.zeros(0), np.zeros(0), [], account_col)
+
+    codes, accounts = pd.factorize(df_positions[account_col])
+    n = len(accounts)
+    known = codes >= 0  # rows without an account id are ignored
+
+    value = numeric_column(df_positions, "Price") * numeric_column(df_positions, "Amount")
+    threshold = numeric_column(df_positions, "liquidationThreshold")
+    types = df_positions["Type"].to_numpy()
+    is_deposit = (types == "Deposit") & known
+    is_borrow = (types == "Borrow") & known
+    codes = np.where(known, codes, 0)
+
+    collateral = np.bincount(codes, weights=np.where(is_deposit, value, 0.0), minlength=n)
+    adjusted = np.bincount(codes, weights=np.where(is_deposit, value * threshold, 0.0), minlength=n)
+    debt = np.bincount(codes, weights=np.where(is_borrow, value, 0.0), minlength=n)
+    return _metrics_frame(collateral, adjusted, debt, accounts, account_col)
+
+
+def _metrics_frame(collateral, adjusted, debt, accounts, account_col):
+    return pd.DataFrame(
+        {
+            "HF": np.round(health_factor(adjusted, debt), 3),
+            "LTV": np.round(loan_to_value(debt, collateral), 3),
+            "Total_Collateral": collateral,
+            "Total_Collateral_Adjusted": adjusted,
+            "Total_Debt": debt,
+        },
+        index=pd.Index(accounts, name=account_col),
+    )
+
+
 def stress_test_calculation_multiple(df, stress_inputs):
+    if isinstance(df, CompactPortfolio):
+        return _stress_compact(df, stress_inputs)
     df_stressed = df.copy()
     prices = {}
+    keys = reserve_keys(df_stressed)
 
     for key, pct in stress_inputs.items():
-        typ, coin = key.split("-")
-        idx = df_stressed["symbol"] == coin
+        typ, coin = key.split("-", 1)
+        idx = keys == coin
         old_price = df_stressed.loc[idx, "Price"].values[0]
         new_price = old_price * (1 - pct/100)
         df_stressed.loc[idx, "Price"] = new_price
@@ -67,42 +144,291 @@ def stress_test_calculation_multiple(df, stress_inputs):
     return df_stressed, prices
 
 
+def _stress_compact(portfolio: CompactPortfolio, stress_inputs):
+    """Stressed copy of a CompactPortfolio: only the small per-symbol price array is copied."""
+    factors = stress_price_factors(stress_inputs)
+    reserves = portfolio.reserves.with_prices(factors)
+    prices = {}
+    held = set(portfolio.symbol.tolist())
+    for coin in factors:
+        code = portfolio.reserves.codes([coin])[0]
+        if code in held:
+            prices[coin] = {"old": float(portfolio.reserves.price[code]), "new": float(reserves.price[code])}
+    return portfolio.with_reserves(reserves), prices
+
 
-def evaluate_row_risk(row, price_changes, hf_global):
+def symbol_exposures(df: pd.DataFrame):
     """
-    Returns True if this row should be highlighted as risky.
-    Conditions:
-    - If HF < 1 after stress → everything is risky.
-    - If asset price dropped > 20% (or custom threshold).
-    - If deposit collateral has very low adjusted collateral value.
-    - If borrow value compared to collateral pushes LTV high.
+    Per-symbol value of a single portfolio at current prices, indexed by
+    reserve key (chain:symbol when the table has a chain column).
+    Collateral_Adjusted is the liquidation-threshold weighted deposit value,
+    Collateral the raw deposit value and Debt the borrowed value. HF and LTV
+    are linear in each price, so these are all a price scenario needs.
     """
-    symbol = row.get("Coin")
-    amount = float(row.get("Amount") or 0)
+    value = numeric_column(df, "Price") * numeric_column(df, "Amount")
+    threshold = numeric_column(df, "liquidationThreshold")
+    is_deposit = (df["Type"] == "Deposit").to_numpy()
+    is_borrow = (df["Type"] == "Borrow").to_numpy()
+    exposures = pd.DataFrame({
+        "symbol": reserve_keys(df).to_numpy(),
+        "Price": numeric_column(df, "Price"),
+        "Collateral_Adjusted": np.where(is_deposit, value * threshold, 0.0),
+        "Collateral": np.where(is_deposit, value, 0.0),
+        "Debt": np.where(is_borrow, value, 0.0),
+    })
+    return exposures.groupby("symbol", sort=False).agg({
+        "Price": "first",
+        "Collateral_Adjusted": "sum",
+        "Collateral": "sum",
+        "Debt": "sum",
+    })
 
-    # Global HF rule
-    if hf_global is not None and hf_global < 1:
-        return True
 
-    # Price drop rule
-    if symbol in price_changes:
-        before, after = price_changes[symbol]
-        if before > 0 and (before - after) / before > 0.20:  # 20% drop
-            return True
+def price_sensitivities(df: pd.DataFrame):
+    """
+    Exact first-order price sensitivities of a single portfolio's HF and LTV.
+    HF = A / D and LTV = D / C with every total linear in each price, so per
+    symbol dHF/dP = (a D - A d) / (P D^2) and dLTV/dP = (d C - D c) / (P C^2),
+    where a, c, d are the symbol's adjusted collateral, collateral and debt.
+    HF_per_pct / LTV_per_pct are the changes for a +1% price move, and
+    Risk_Share is each symbol's share of the total absolute HF sensitivity.
+    Rows are ranked by that share; values are NaN where HF or LTV is undefined.
+    """
+    exposures = symbol_exposures(df)
+    price = exposures["Price"].to_numpy()
+    a = exposures["Collateral_Adjusted"].to_numpy()
+    c = exposures["Collateral"].to_numpy()
+    d = exposures["Debt"].to_numpy()
+    A, C, D = a.sum(), c.sum(), d.sum()
 
-    # Collateral rule (deposits table)
-    if "Adjusted_Collateral_Value" in row:
-        if float(row["Adjusted_Collateral_Value"]) < 1:
-            return True
+    hf_pct = (a * D - A * d) / D ** 2 / 100 if D > 0 else np.full(len(d), np.nan)
+    ltv_pct = (d * C - D * c) / C ** 2 / 100 if C > 0 else np.full(len(c), np.nan)
+    scale = np.full(len(price), np.nan)
+    np.divide(100.0, price, out=scale, where=price > 0)
+    total = np.nansum(np.abs(hf_pct))
 
-    # Loan rule (borrows table)
-    if "Borrow_Value" in row and "Total_Collateral" in row:
-        ltv = row["Borrow_Value"] / row["Total_Collateral"] if row["Total_Collateral"] > 0 else 0
-        if ltv > 0.60:  # high LTV
-            return True
+    result = pd.DataFrame({
+        "Price": price,
+        "Side": np.select([(c > 0) & (d > 0), c > 0, d > 0], ["Both", "Deposit", "Borrow"], "None"),
+        "dHF_dP": hf_pct * scale,
+        "dLTV_dP": ltv_pct * scale,
+        "HF_per_pct": hf_pct,
+        "LTV_per_pct": ltv_pct,
+        "Risk_Share": np.abs(hf_pct) / total if total > 0 else np.full(len(price), np.nan),
+    }, index=exposures.index)
+    return result.sort_values("Risk_Share", ascending=False, na_position="last")
+
+
+def estimate_stress_linear(sensitivities, stress_inputs, hf, ltv):
+    """
+    First-order HF and LTV estimate for slider-style `stress_inputs`
+    ({"supply-ETH": 10} = 10% drop) from price_sensitivities, without
+    re-running the stress test. Exact for HF/LTV up to the curvature of the
+    ratio, so best for small shocks.
+    """
+    factors = stress_price_factors(stress_inputs)
+    pct_moves = pd.Series({coin: (float(f) - 1) * 100 for coin, f in factors.items()}, dtype=np.float64)
+    pct_moves = pct_moves.reindex(sensitivities.index).fillna(0.0)
+    hf_est = hf + float(np.nansum(sensitivities["HF_per_pct"] * pct_moves)) if np.isfinite(hf) else hf
+    ltv_est = None if ltv is None else ltv + float(np.nansum(sensitivities["LTV_per_pct"] * pct_moves))
+    return round(hf_est, 3), (None if ltv_est is None else round(ltv_est, 3))
+
+
+def liquidation_prices(df_positions: pd.DataFrame, account_col=None):
+    """
+    Price of every held asset at which its portfolio reaches HF = 1, other prices unchanged.
+    With c the LT-weighted deposited amount and d the borrowed amount of an
+    asset, HF = (C_other + c*p) / (D_other + d*p), so the break-even price is
+    p* = (D_other - C_other) / (c - d). Solved for every (account, symbol) in
+    one pass; without `account_col` the table is one portfolio. With a chain
+    column, symbol in the result is the chain:symbol reserve key.
+
+    Distance_Pct is the move from the current price to p* (negative = drop).
+    Trigger says on which side of p* the portfolio is under HF 1: "below" for
+    net collateral assets, "above" for net debt assets.
+    Liquidation_Price is NaN when no positive price of that asset alone hits HF 1;
+    Trigger is then "always" if the portfolio stays under HF 1 at any price of it.
+    """
+    columns = ["symbol", "Side", "Price", "Liquidation_Price", "Distance_Pct", "Trigger"]
+    if df_positions is None or df_positions.empty:
+        return pd.DataFrame(columns=[account_col, *columns] if account_col else columns)
+
+    price = numeric_column(df_positions, "Price")
+    amount = numeric_column(df_positions, "Amount")
+    threshold = numeric_column(df_positions, "liquidationThreshold")
+    is_deposit = (df_positions["Type"] == "Deposit").to_numpy()
+    is_borrow = (df_positions["Type"] == "Borrow").to_numpy()
+    if account_col:
+        account_codes, accounts = pd.factorize(df_positions[account_col])
+    else:
+        account_codes, accounts = np.zeros(len(df_positions), dtype=np.int64), np.zeros(1, dtype=np.int64)
+    symbol_codes, symbols = pd.factorize(reserve_keys(df_positions))
+
+    pair_keys, pair_codes = np.unique(account_codes * len(symbols) + symbol_codes, return_inverse=True)
+    pair_accounts, pair_symbols = np.divmod(pair_keys, len(symbols))
+    n_pairs = len(pair_keys)
+    c = np.bincount(pair_codes, weights=np.where(is_deposit, amount * threshold, 0.0), minlength=n_pairs)
+    d = np.bincount(pair_codes, weights=np.where(is_borrow, amount, 0.0), minlength=n_pairs)
+    pair_price = np.zeros(n_pairs)
+    pair_price[pair_codes] = price  # one price per symbol, as in stress_test_calculation_multiple
 
-    return False
+    collateral = np.bincount(pair_accounts, weights=c * pair_price)
+    debt = np.bincount(pair_accounts, weights=d * pair_price)
+    collateral_other = collateral[pair_accounts] - c * pair_price
+    debt_other = debt[pair_accounts] - d * pair_price
 
+    denominator = c - d
+    break_even = np.full(n_pairs, np.nan)
+    np.divide(debt_other - collateral_other, denominator, out=break_even, where=denominator != 0)
+    always = ((denominator < 0) & ~(break_even > 0)) | ((denominator == 0) & (collateral_other < debt_other))
+    break_even[~(break_even > 0)] = np.nan
+    distance = np.full(n_pairs, np.nan)
+    np.divide((break_even - pair_price) * 100, pair_price, out=distance, where=pair_price > 0)
 
+    result = pd.DataFrame({
+        "symbol": np.asarray(symbols)[pair_symbols],
+        "Side": np.select([(c > 0) & (d > 0), c > 0, d > 0], ["Both", "Deposit", "Borrow"], "None"),
+        "Price": pair_price,
+        "Liquidation_Price": break_even,
+        "Distance_Pct": np.round(distance, 2),
+        "Trigger": np.select(
+            [~np.isnan(break_even) & (denominator > 0), ~np.isnan(break_even), always],
+            ["below", "above", "always"],
+            None,
+        ),
+    })
+    if account_col:
+        result.insert(0, account_col, np.asarray(accounts)[pair_accounts])
+    return result
 
 
+def stress_price_factors(stress_inputs):
+    """
+    Price multiplier per reserve key for slider-style inputs such as
+    {"supply-ETH": 25} or, for multi-chain tables, {"supply-arbitrum:ETH": 25}.
+    Several keys for the same symbol compound, as in stress_test_calculation_multiple.
+    """
+    factors = {}
+    for key, pct in stress_inputs.items():
+        typ, coin = key.split("-", 1)
+        factors[coin] = factors.get(coin, 1.0) * (1 - np.asarray(pct, dtype=np.float64) / 100)
+    return factors
+
+
+def stress_response_surface(df: pd.DataFrame):
+    """
+    Precomputed HF / LTV response of a portfolio to price drops.
+    Both totals are linear in every price, so the whole surface over any grid
+    of shock levels is described by the per-symbol exposures plus the totals.
+    The result is JSON-serialisable for a dcc.Store and a clientside callback.
+    """
+    exposures = symbol_exposures(df)
+    return {
+        "symbols": exposures.index.tolist(),
+        "collateral_adjusted": exposures["Collateral_Adjusted"].tolist(),
+        "collateral": exposures["Collateral"].tolist(),
+        "debt": exposures["Debt"].tolist(),
+    }
+
+
+def evaluate_stress_surface(surface, stress_inputs):
+    """
+    HF and LTV after the drops in `stress_inputs`, read from a precomputed surface.
+    Drop levels may be arrays, in which case HF and LTV come back as arrays of
+    the broadcast shape (e.g. a meshgrid of shock levels for two coins).
+    """
+    factors = stress_price_factors(stress_inputs)
+    collateral_adjusted = collateral = debt = 0.0
+    for i, symbol in enumerate(surface["symbols"]):
+        factor = factors.get(symbol, 1.0)
+        collateral_adjusted = collateral_adjusted + surface["collateral_adjusted"][i] * factor
+        collateral = collateral + surface["collateral"][i] * factor
+        debt = debt + surface["debt"][i] * factor
+
+    hf = np.round(health_factor(collateral_adjusted, debt), 3)
+    ltv = np.round(loan_to_value(debt, collateral), 3)
+    if hf.ndim == 0:
+        return float(hf), float(ltv)
+    return hf, ltv
+
+
+def _correlated_normals(cov, n_scenarios, rng):
+    try:
+        factor = np.linalg.cholesky(cov)
+    except np.linalg.LinAlgError:
+        # Positive semi-definite (e.g. perfectly correlated assets)
+        eigenvalues, eigenvectors = np.linalg.eigh(cov)
+        factor = eigenvectors * np.sqrt(np.clip(eigenvalues, 0, None))
+    return rng.standard_normal((n_scenarios, cov.shape[0])) @ factor.T
+
+
+def monte_carlo_stress(df, cov, symbols=None, n_scenarios=10000, mean=None,
+                       percentiles=(1, 5, 25, 50, 75, 95, 99), seed=None):
+    """
+    Monte Carlo stress test with correlated price shocks.
+    `cov` is the covariance of simple price returns, either a DataFrame indexed
+    by symbol on both axes or an array ordered like `symbols`; `mean` is an
+    optional drift per symbol. Portfolio assets not covered by `cov` keep their
+    price. All scenarios are applied as one (scenarios x assets) matrix product.
+
+    Returns a dict with the HF of every scenario, the probability of HF < 1
+    and the requested HF percentiles.
+    """
+    if isinstance(cov, pd.DataFrame):
+        symbols = list(cov.index)
+        cov = cov.loc[symbols, symbols].to_numpy(dtype=np.float64)
+    elif symbols is None:
+        raise ValueError("symbols is required when cov is an array (or pass cov as a DataFrame indexed by symbol)")
+    cov = np.asarray(cov, dtype=np.float64)
+    symbols = list(symbols)
+    if cov.shape != (len(symbols), len(symbols)):
+        raise ValueError(f"cov has shape {cov.shape}, expected ({len(symbols)}, {len(symbols)}) for {len(symbols)} symbols")
+    if mean is None:
+        mean = np.zeros(len(symbols))
+    elif isinstance(mean, (dict, pd.Series)):
+        mean = pd.Series(mean).reindex(symbols).fillna(0).to_numpy(dtype=np.float64)
+    else:
+        mean = np.asarray(mean, dtype=np.float64)
+
+    exposures = symbol_exposures(df)
+    shocked = [i for i, s in enumerate(symbols) if s in exposures.index]
+    shocked_symbols = [symbols[i] for i in shocked]
+    fixed = exposures.drop(index=shocked_symbols)
+    moved = exposures.loc[shocked_symbols]
+
+    rng = np.random.default_rng(seed)
+    returns = _correlated_normals(cov[np.ix_(shocked, shocked)], n_scenarios, rng) + mean[shocked]
+    factors = np.clip(1.0 + returns, 0.0, None)  # prices cannot go negative
+
+    collateral = factors @ moved["Collateral_Adjusted"].to_numpy() + fixed["Collateral_Adjusted"].sum()
+    debt = factors @ moved["Debt"].to_numpy() + fixed["Debt"].sum()
+    hf = health_factor(collateral, debt)
+
+    return {
+        "hf": hf,
+        "prob_liquidation": float(np.mean(hf < 1)),
+        "percentiles": dict(zip(percentiles, np.percentile(hf, percentiles, method="nearest").tolist())),
+    }
+
+
+def evaluate_row_risk(row, price_changes, hf_global, rules=DEFAULT_RULES):
+    """
+    Returns True if this row should be highlighted as risky, using the same
+    rules as the stress tables (risk_rules.DEFAULT_RULES):
+    - If HF < 1 after stress → everything is risky.
+    - If asset price dropped > 10%.
+    - If deposit collateral has very low adjusted collateral value.
+    - If borrow value compared to collateral pushes LTV high.
+    For whole tables use risk_rules.flag_risk instead.
+    """
+    before, after = price_changes.get(row.get("Coin"), (np.nan, np.nan))
+    total_collateral = float(row.get("Total_Collateral", 0) or 0)
+    metrics = {
+        "hf": np.nan if hf_global is None else hf_global,
+        "price_ratio": after / before if before > 0 else np.nan,
+        "adjusted_collateral_value": float(row.get("Adjusted_Collateral_Value", np.nan)),
+        "borrow_ltv": np.nan,
+    }
+    if "Borrow_Value" in row and "Total_Collateral" in row:
+        metrics["borrow_ltv"] = row["Borrow_Value"] / total_collateral if total_collateral > 0 else 0
+    return bool(evaluate_rules(metrics, rules)[0])
@@ -0,0 +1,208 @@
+# ------------------------- cascade.py -------------------------
+# Protocol-wide liquidation cascade with liquidity-based price impact.
+#
+# A shock (slider-style stress inputs) moves prices; every account with HF < 1
+# is liquidated: `close_factor` of its debt is repaid and collateral worth the
+# repaid value plus `liquidation_bonus` is seized pro rata from its deposits
+# and sold. Sales push each asset's price down by
+#     price = shocked_price * exp(-impact * sold_usd / totalLiquidity)
+# (sold_usd is cumulative, valued at the shocked price), which can put more
+# accounts under water. Rounds repeat until nobody is liquidatable, prices
+# stop moving, or `max_rounds` is reached.
+#
+# Positions are kept as a sparse account x asset matrix in two layouts (rows
+# sorted by account and a permutation sorted by asset), so a round only
+# revalues the positions of liquidated accounts and of repriced assets, and
+# only re-checks the accounts those touch.
+import numpy as np
+import pandas as pd
+
+from calculations import stress_price_factors
+from positions import CompactPortfolio, ReserveTable
+from risk_math import health_factor
+
+
+def _slices(codes, n):
+    """Start offsets of each code's run in a sorted code array (length n + 1)."""
+    return np.searchsorted(codes, np.arange(n + 1))
+
+
+def _ranges(starts, stops):
+    """Concatenated np.arange(start, stop) for every pair, without a Python loop."""
+    lengths = stops - starts
+    total = int(lengths.sum())
+    if total == 0:
+        return np.zeros(0, dtype=np.int64)
+    offsets = np.repeat(starts - np.concatenate([[0], np.cumsum(lengths)[:-1]]), lengths)
+    return np.arange(total, dtype=np.int64) + offsets
+
+
+def simulate_cascade(positions, shock=None, reserves=None, account_col="account", close_factor=0.5,
+                     liquidation_bonus=0.05, impact=1.0, max_rounds=50, price_tol=1e-9):
+    """
+    Run a liquidation cascade over a book of positions.
+    `positions` is a CompactPortfolio or a long positions table (then
+    `reserves` is the reserve DataFrame with totalLiquidity); `shock` holds
+    slider-style inputs such as {"supply-ETH": 30}. Assets without
+    totalLiquidity are sold without price impact.
+
+    Returns a dict with:
+      rounds      per-round DataFrame (accounts liquidated, debt repaid and
+                  collateral sold in USD, accounts below HF 1 after the round)
+      prices      DataFrame per asset: Price, Shocked_Price, Final_Price,
+                  Sold_Units, Sold_USD, Price_Change (%)
+      accounts    DataFrame per account: HF_Before, HF_Shocked, HF_After,
+                  Liquidations (times liquidated), Debt_Repaid, Bad_Debt
+      converged   False when max_rounds stopped the cascade
+    """
+    if not isinstance(positions, CompactPortfolio):
+        positions = CompactPortfolio.from_frame(positions, ReserveTable.from_frame(reserves), account_col)
+    table = positions.reserves
+    n_assets, n_accounts = len(table), positions.n_accounts
+
+    # Drop positions without a reserve (valued at 0 everywhere). Rows are
+    # stored by asset, so a repriced asset is one contiguous slice; by_account
+    # lists each account's rows for the liquidation step.
+    known = positions.symbol >= 0
+    order = np.lexsort((positions.account[known], positions.symbol[known]))
+    account = positions.account[known][order].astype(np.int64)
+    asset = positions.symbol[known][order].astype(np.int64)
+    is_borrow = positions.is_borrow[known][order]
+    amount = positions.amount[known][order].copy()
+    threshold = table.liquidation_threshold[asset]
+    asset_bounds = _slices(asset, n_assets)
+    by_account = np.argsort(account, kind="stable")
+    account_bounds = _slices(account[by_account], n_accounts)
+
+    def account_sums(rows, row_price):
+        """(adjusted collateral, collateral, debt) per account over position `rows` at `row_price`."""
+        value = amount[rows] * row_price
+        deposit = np.where(is_borrow[rows], 0.0, value)
+        return (np.bincount(account[rows], weights=deposit * threshold[rows], minlength=n_accounts),
+                np.bincount(account[rows], weights=deposit, minlength=n_accounts),
+                np.bincount(account[rows], weights=np.where(is_borrow[rows], value, 0.0), minlength=n_accounts))
+
+    base_price = table.price.copy()
+    shocked_price = table.with_prices(stress_price_factors(shock or {})).price
+    liquidity = table.extra.get("totalLiquidity", np.zeros(n_assets))
+    price = shocked_price.copy()
+
+    all_rows = slice(None)
+    hf_before = health_factor(*account_sums(all_rows, base_price[asset])[::2])
+    adjusted, collateral, debt = account_sums(all_rows, price[asset])
+    hf_shocked = health_factor(adjusted, debt)
+
+    # Between rounds only the sign of adjusted collateral - debt matters, so
+    # one running margin per account (one bincount per repricing) is kept;
+    # debt and collateral are recomputed for the accounts being liquidated.
+    signed_units = amount * np.where(is_borrow, -1.0, threshold)
+    margin = adjusted - debt
+    has_debt, has_collateral = debt > 0, collateral > 0
+
+    sold_units = np.zeros(n_assets)
+    liquidations = np.zeros(n_accounts, dtype=np.int64)
+    repaid_total = np.zeros(n_accounts)
+    candidates = np.arange(n_accounts)
+    history = []
+    converged = False
+    for round_number in range(1, max_rounds + 1):
+        # Only accounts with something left to seize can be liquidated
+        liquidatable = candidates[(margin[candidates] < 0) & has_debt[candidates] & has_collateral[candidates]]
+        if len(liquidatable) == 0:
+            converged = True
+            break
+
+        rows = by_account[_ranges(account_bounds[liquidatable], account_bounds[liquidatable + 1])]
+        _, collateral, debt = account_sums(rows, price[asset[rows]])
+        # has_collateral is only refreshed for liquidated accounts; repricing
+        # (down to 0 in very thin markets) can have emptied the others
+        emptied = collateral[liquidatable] <= 0
+        if emptied.any():
+            has_collateral[liquidatable[emptied]] = False
+            liquidatable = liquidatable[~emptied]
+            selected = np.zeros(n_accounts, dtype=bool)
+            selected[liquidatable] = True
+            rows = rows[selected[account[rows]]]
+            if len(liquidatable) == 0:
+                converged = True
+                break
+        repaid = close_factor * debt[liquidatable]
+        seized = np.minimum(repaid * (1 + liquidation_bonus), collateral[liquidatable])
+        seized_share = np.zeros(n_accounts)
+        seized_share[liquidatable] = seized / collateral[liquidatable]
+        repaid_total[liquidatable] += repaid
+        liquidations[liquidatable] += 1
+
+        deposit_rows = rows[~is_borrow[rows]]
+        seized_units = amount[deposit_rows] * seized_share[account[deposit_rows]]
+        amount[deposit_rows] -= seized_units
+        amount[rows[is_borrow[rows]]] *= 1 - close_factor
+        signed_units[rows] = amount[rows] * np.where(is_borrow[rows], -1.0, threshold[rows])
+        sold = np.bincount(asset[deposit_rows], weights=seized_units, minlength=n_assets)
+        sold_units += sold
+        sold_usd = float((sold * price).sum())
+
+        # Liquidated accounts are revalued from scratch at the old prices...
+        adjusted, collateral, debt = account_sums(rows, price[asset[rows]])
+        margin[liquidatable] = adjusted[liquidatable] - debt[liquidatable]
+        has_collateral[liquidatable] = collateral[liquidatable] > 0
+
+        # ...then every position in a repriced asset gets the price delta
+        exponent = np.zeros(n_assets)
+        np.divide(impact * sold_units * shocked_price, liquidity, out=exponent, where=liquidity > 0)
+        new_price = shocked_price * np.exp(-exponent)
+        moved = np.flatnonzero(np.abs(new_price - price) > price_tol * price)
+        lengths = asset_bounds[moved + 1] - asset_bounds[moved]
+        if lengths.sum() == len(amount):
+            repriced_rows = all_rows
+        else:
+            repriced_rows = _ranges(asset_bounds[moved], asset_bounds[moved + 1])
+        row_delta = np.repeat(new_price[moved] - price[moved], lengths)
+        price[moved] = new_price[moved]
+        margin += np.bincount(account[repriced_rows], weights=signed_units[repriced_rows] * row_delta,
+                              minlength=n_accounts)
+
+        if repriced_rows is all_rows:
+            candidates = np.arange(n_accounts)
+        else:
+            touched = np.zeros(n_accounts, dtype=bool)
+            touched[liquidatable] = True
+            touched[account[repriced_rows]] = True
+            candidates = np.flatnonzero(touched)
+        history.append({
+            "round": round_number,
+            "accounts_liquidated": len(liquidatable),
+            "debt_repaid_usd": float(repaid.sum()),
+            "collateral_sold_usd": sold_usd,
+            "accounts_below_hf_1": int(np.count_nonzero((margin < 0) & has_debt)),
+            "assets_repriced": len(moved),
+        })
+
+    # The running margin drifts a little over many rounds: report HF from a fresh pass
+    adjusted, collateral, debt = account_sums(all_rows, price[asset])
+    hf_after = health_factor(adjusted, debt)
+    sold_usd = sold_units * shocked_price
+    price_change = np.full(n_assets, np.nan)
+    np.divide(price - base_price, base_price, out=price_change, where=base_price > 0)
+
+    return {
+        "rounds": pd.DataFrame(history, columns=["round", "accounts_liquidated", "debt_repaid_usd",
+                                                 "collateral_sold_usd", "accounts_below_hf_1", "assets_repriced"]),
+        "prices": pd.DataFrame({
+            "Price": base_price,
+            "Shocked_Price": shocked_price,
+            "Final_Price": price,
+            "Sold_Units": sold_units,
+            "Sold_USD": sold_usd,
+            "Price_Change": np.round(price_change * 100, 3),
+        }, index=pd.Index(table.symbols, name="symbol")),
+        "accounts": pd.DataFrame({
+            "HF_Before": np.round(hf_before, 3),
+            "HF_Shocked": np.round(hf_shocked, 3),
+            "HF_After": np.round(hf_after, 3),
+            "Liquidations": liquidations,
+            "Debt_Repaid": repaid_total,
+            "Bad_Debt": np.where(collateral <= 0, debt, 0.0),
+        }, index=pd.Index(positions.accounts, name=account_col)),
+        "converged": converged,
+    }
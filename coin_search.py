@@ -0,0 +1,63 @@
+# ------------------------- coin_search.py -------------------------
+# Server-side coin search for the Dash dropdowns: the client only receives
+# the options matching what the user typed, never the whole asset universe.
+import difflib
+from bisect import bisect_left
+from functools import lru_cache
+
+DEFAULT_LIMIT = 50
+
+
+class CoinIndex:
+    """
+    Search index over one reserve table's symbols. Matches are ranked
+    prefix first (binary search over the sorted symbols), then substring,
+    then fuzzy (difflib) for typos. Option dicts are built once and results
+    are memoized per query.
+    """
+
+    def __init__(self, symbols):
+        self.symbols = sorted({str(s).upper() for s in symbols if s})
+        self.options = {s: {"label": s, "value": s} for s in self.symbols}
+        self.search = lru_cache(maxsize=1024)(self._search)
+
+    def _search(self, query, limit=DEFAULT_LIMIT):
+        query = (query or "").strip().upper()
+        if not query:
+            return tuple(self.symbols[:limit])
+
+        matches = []
+        i = bisect_left(self.symbols, query)
+        while i < len(self.symbols) and self.symbols[i].startswith(query) and len(matches) < limit:
+            matches.append(self.symbols[i])
+            i += 1
+        if len(matches) < limit:
+            seen = set(matches)
+            matches += [s for s in self.symbols if query in s and s not in seen][:limit - len(matches)]
+        if len(matches) < limit and len(query) > 1:
+            seen = set(matches)
+            close = difflib.get_close_matches(query, self.symbols, n=limit, cutoff=0.6)
+            matches += [s for s in close if s not in seen][:limit - len(matches)]
+        return tuple(matches)
+
+    def search_options(self, query, limit=DEFAULT_LIMIT, keep=()):
+        """Dropdown options for `query`; symbols in `keep` (the current selection) are always included."""
+        found = self.search(query, limit)
+        extra = [s for s in keep if s and s not in found]
+        return [self.options.get(s) or {"label": s, "value": s} for s in (*extra, *found)]
+
+    def __len__(self):
+        return len(self.symbols)
+
+
+_indexes = {}
+
+
+def coin_index(version, load_symbols):
+    """CoinIndex for reserve table `version`, built with `load_symbols()` once per version."""
+    index = _indexes.get(version)
+    if index is None:
+        index = CoinIndex(load_symbols())
+        _indexes.clear()  # only the current version is ever asked for again
+        _indexes[version] = index
+    return index
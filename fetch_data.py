@@ -1,6 +1,34 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+
 import requests
+from requests.adapters import HTTPAdapter
 import pandas as pd
-import streamlit as st
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+THEGRAPH_API_KEY = os.environ.get("THEGRAPH_API_KEY", "c1de085f872244b8443afbff0ade7aa0")
+SUBGRAPH_ID = os.environ.get("THEGRAPH_SUBGRAPH_ID", "JCNWRypm7FYwV8fx5HhzZPSFaMxgkPuw4TnR3Gpi81zk")
+
+# Point the default client elsewhere (e.g. benchmarks/graphql_standin.py) and
+# switch it between live requests, recording them and replaying recordings
+SUBGRAPH_URL = os.environ.get("SUBGRAPH_URL") or None
+SUBGRAPH_MODE = os.environ.get("SUBGRAPH_MODE", "live")
+SUBGRAPH_CASSETTE_DIR = os.environ.get("SUBGRAPH_CASSETTE_DIR", "cassettes")
+
+RESERVE_CACHE_TTL = float(os.environ.get("RESERVE_CACHE_TTL", 300))
+RESERVE_CACHE_RETRY = float(os.environ.get("RESERVE_CACHE_RETRY", 30))  # first backoff after a failed refresh
+RESERVE_CACHE_JITTER = float(os.environ.get("RESERVE_CACHE_JITTER", 0.1))  # random extra TTL, as a fraction of it
+RESERVE_SNAPSHOT_PATH = os.environ.get("RESERVE_SNAPSHOT_PATH", "reserves_snapshot.parquet")
 
 """
 # --> deprecated
@@ -36,30 +64,204 @@ def get_coin_list():
     return merged_df
 """
 
-def get_reserves():
-    api = "c1de085f872244b8443afbff0ade7aa0"
-    subgraph_id = "JCNWRypm7FYwV8fx5HhzZPSFaMxgkPuw4TnR3Gpi81zk"
-    url = f"https://gateway.thegraph.com/api/{api}/subgraphs/id/{subgraph_id}"
-    
-    query = """
-    {
-        markets(first: 1000) {
-            inputToken {
-                symbol
-                lastPriceUSD
-            }
-            totalDepositBalanceUSD
-            totalBorrowBalanceUSD
-            liquidationThreshold
-        }
-    }
+class SubgraphError(Exception):
+    """Raised when a subgraph query keeps failing or returns GraphQL errors."""
+
+
+def _selection(fields):
+    """GraphQL selection set from a field projection such as ["id", {"inputToken": ["symbol"]}]."""
+    parts = []
+    for field in fields:
+        if isinstance(field, dict):
+            for name, sub_fields in field.items():
+                parts.append(f"{name} {{ {_selection(sub_fields)} }}")
+        else:
+            parts.append(field)
+    return " ".join(parts)
+
+
+def _literal(value):
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (list, tuple)):
+        return "[" + ", ".join(_literal(v) for v in value) + "]"
+    if isinstance(value, str):
+        return json.dumps(value)
+    return str(value)
+
+
+def _retryable(exc):
+    """Only transient failures are retried: connection errors, timeouts, HTTP 5xx and 429."""
+    if isinstance(exc, (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError)):
+        return True
+    if isinstance(exc, requests.HTTPError) and exc.response is not None:
+        return exc.response.status_code >= 500 or exc.response.status_code == 429
+    return False
+
+
+class SubgraphClient:
     """
-    
-    response = requests.post(url, json={"query": query})
-    data = response.json()
-    
-    # ✅ The Graph returns data under 'data' → 'markets'
-    markets = data.get("data", {}).get("markets", [])
+    Reusable client for one subgraph endpoint.
+    Keeps a pooled keep-alive session, applies a per-request timeout, retries
+    transient failures (connection errors, timeouts, HTTP 5xx / 429) with
+    exponential backoff, fails at once on anything else (GraphQL errors, other
+    4xx, malformed JSON) and records the duration of every
+    request in `timings` (seconds, most recent last).
+
+    In "record" mode every successful response is also written to
+    `cassette_dir`, keyed by a hash of the query and variables; "replay" mode
+    answers from those files without touching the network.
+    """
+
+    def __init__(self, url, timeout=10, max_retries=4, backoff=0.5, pool_size=10,
+                 mode="live", cassette_dir=SUBGRAPH_CASSETTE_DIR):
+        if mode not in ("live", "record", "replay"):
+            raise ValueError(f"Unknown subgraph client mode: {mode}")
+        self.url = url
+        self.mode = mode
+        self.cassette_dir = cassette_dir
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.timings = deque(maxlen=1000)
+
+    def close(self):
+        """Close the pooled connections."""
+        self.session.close()
+
+    def _cassette_path(self, query, variables):
+        key = json.dumps({"query": query, "variables": variables or {}}, sort_keys=True)
+        return os.path.join(self.cassette_dir, hashlib.sha256(key.encode()).hexdigest()[:32] + ".json")
+
+    def _replay(self, query, variables):
+        start = time.perf_counter()
+        path = self._cassette_path(query, variables)
+        try:
+            with open(path) as f:
+                return json.load(f)["response"].get("data") or {}
+        except FileNotFoundError:
+            raise SubgraphError(f"No recorded response for this query in {self.cassette_dir}") from None
+        finally:
+            self.timings.append(time.perf_counter() - start)
+
+    def _record(self, query, variables, payload):
+        os.makedirs(self.cassette_dir, exist_ok=True)
+        with open(self._cassette_path(query, variables), "w") as f:
+            json.dump({"request": {"query": query, "variables": variables or {}}, "response": payload}, f)
+
+    def query(self, query, variables=None):
+        """Run one GraphQL query and return its `data` payload."""
+        if self.mode == "replay":
+            return self._replay(query, variables)
+        for attempt in range(self.max_retries + 1):
+            start = time.perf_counter()
+            outcome = "error"
+            try:
+                response = self.session.post(
+                    self.url, json={"query": query, "variables": variables or {}}, timeout=self.timeout
+                )
+                response.raise_for_status()
+                payload = response.json()
+                if payload.get("errors"):
+                    raise SubgraphError(payload["errors"])
+                if self.mode == "record":
+                    self._record(query, variables, payload)
+                outcome = "ok"
+                return payload.get("data") or {}
+            except (requests.RequestException, ValueError, SubgraphError) as exc:
+                if not _retryable(exc):
+                    raise SubgraphError(f"Query failed: {exc}") from exc
+                if attempt == self.max_retries:
+                    raise SubgraphError(f"Query failed after {attempt + 1} attempts: {exc}") from exc
+                delay = self.backoff * 2 ** attempt * (1 + random.random() / 2)
+                logger.warning("Subgraph request failed (%s), retrying in %.1fs", exc, delay)
+                time.sleep(delay)
+            finally:
+                elapsed = time.perf_counter() - start
+                self.timings.append(elapsed)
+                metrics.histogram("subgraph_request_duration_seconds", "Subgraph HTTP request duration").labels(
+                    outcome=outcome).observe(elapsed)
+
+    def paginate(self, entity, fields, page_size=1000, where=None):
+        """
+        Yield every `entity` row, following an `id_gt` cursor so results are never
+        truncated at `first`. `fields` is the projection passed to the query;
+        `id` is always requested because the cursor needs it.
+        """
+        if "id" not in fields:
+            fields = ["id", *fields]
+        filters = "".join(f", {key}: {_literal(value)}" for key, value in (where or {}).items())
+        query = (
+            "query($first: Int!, $lastId: String!) {"
+            f" {entity}(first: $first, orderBy: id, orderDirection: asc,"
+            f" where: {{id_gt: $lastId{filters}}}) {{ {_selection(fields)} }} }}"
+        )
+        last_id = ""
+        while True:
+            rows = self.query(query, {"first": page_size, "lastId": last_id}).get(entity, [])
+            yield from rows
+            if len(rows) < page_size:
+                return
+            last_id = rows[-1]["id"]
+
+    def timing_stats(self):
+        """Count, mean and tail latency (ms) of the recorded requests."""
+        if not self.timings:
+            return {"count": 0}
+        timings = sorted(self.timings)
+        def pct(p):
+            return timings[min(len(timings) - 1, int(p * len(timings)))] * 1000
+        return {
+            "count": len(timings),
+            "mean_ms": sum(timings) / len(timings) * 1000,
+            "p50_ms": pct(0.50),
+            "p95_ms": pct(0.95),
+            "p99_ms": pct(0.99),
+            "max_ms": timings[-1] * 1000,
+        }
+
+
+def subgraph_url(subgraph_id=SUBGRAPH_ID, api_key=THEGRAPH_API_KEY):
+    return f"https://gateway.thegraph.com/api/{api_key}/subgraphs/id/{subgraph_id}"
+
+
+MARKET_FIELDS = [
+    {"inputToken": ["symbol", "lastPriceUSD"]},
+    "totalDepositBalanceUSD",
+    "totalBorrowBalanceUSD",
+    "liquidationThreshold",
+]
+
+_default_client = None
+
+
+def get_default_client():
+    global _default_client
+    if _default_client is None:
+        _default_client = SubgraphClient(SUBGRAPH_URL or subgraph_url(), mode=SUBGRAPH_MODE)
+    return _default_client
+
+
+def _reset_default_client():
+    # A forked process (e.g. a gunicorn worker after warm_up fetched in the
+    # master) must not reuse the parent's pooled sockets: drop its copies and
+    # let the next request open its own
+    global _default_client
+    client, _default_client = _default_client, None
+    if client is not None:
+        client.close()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_default_client)
+
+
+def markets_to_reserves(markets):
+    """Reserve table (one row per market) from raw subgraph `markets` rows."""
     result = {"reserves": []}
     
     for market in markets:
@@ -75,7 +277,8 @@ def get_reserves():
     df = pd.DataFrame(result["reserves"])
     
     if "symbol" not in df.columns or df.empty:
-        print("symbol not found")
+        logger.warning("Subgraph returned no reserves with a symbol")
+        return pd.DataFrame(columns=["symbol", "totalLiquidity", "totalBorrows", "liquidationThreshold", "Price"])
     
     df["symbol"] = df["symbol"].str.upper()
     df[["Price", "totalLiquidity", "totalBorrows", "liquidationThreshold"]] = df[["Price", "totalLiquidity", "totalBorrows", "liquidationThreshold"]].astype(float)
@@ -83,4 +286,218 @@ def get_reserves():
     # removes assets which don't have liquidationThreshold and price
     df = df[(df["liquidationThreshold"] > 0) & (df["Price"] > 0)]
     
-    return df
\ No newline at end of file
+    return df
+
+
+def get_reserves(client=None):
+    client = client or get_default_client()
+    markets = list(client.paginate("markets", MARKET_FIELDS))
+    return markets_to_reserves(markets)
+
+
+async def _fetch_chain_reserves(chain, client, semaphore):
+    async with semaphore:
+        df = await asyncio.to_thread(get_reserves, client)
+    df = df.copy()
+    df.insert(0, "chain", chain)
+    return df
+
+
+async def fetch_reserves_multi(deployments, max_concurrency=4):
+    """
+    Fetch reserves of several deployments concurrently.
+    `deployments` maps a chain (or chain/market label) to its subgraph URL or
+    SubgraphClient; at most `max_concurrency` deployments are queried at once.
+    Returns one reserve table with a `chain` column, unique per (chain, symbol).
+    Deployments that fail are logged and left out. Clients created here from
+    URLs are closed before returning; SubgraphClients passed in are left open.
+
+    positions.ReserveTable and the calculations key such a table by
+    "chain:symbol" (positions.reserve_keys), so positions need a chain column
+    too (merge on ["chain", "symbol"]) and the same asset on two chains stays
+    two reserves. app.py's tables have no chain column: select one chain there
+    (df[df["chain"] == chain]).
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+    clients, owned = {}, []
+    for chain, target in deployments.items():
+        if not isinstance(target, SubgraphClient):
+            target = SubgraphClient(target)
+            owned.append(target)
+        clients[chain] = target
+    try:
+        results = await asyncio.gather(
+            *(_fetch_chain_reserves(chain, client, semaphore) for chain, client in clients.items()),
+            return_exceptions=True,
+        )
+    finally:
+        for client in owned:
+            client.close()
+
+    frames = []
+    for chain, result in zip(clients, results):
+        if isinstance(result, Exception):
+            logger.error("Reserve fetch for %s failed: %s", chain, result)
+        elif not result.empty:
+            frames.append(result)
+    if not frames:
+        return pd.DataFrame(columns=["chain", "symbol", "totalLiquidity", "totalBorrows",
+                                     "liquidationThreshold", "Price"])
+
+    df = pd.concat(frames, ignore_index=True)
+    # A symbol listed twice on one chain keeps its deepest market
+    df = df.sort_values("totalLiquidity", ascending=False).drop_duplicates(["chain", "symbol"])
+    return df.sort_values(["chain", "symbol"]).reset_index(drop=True)
+
+
+def get_reserves_multi(deployments, max_concurrency=4):
+    """Blocking wrapper around fetch_reserves_multi (not a ReserveCache loader for app.py, see there)."""
+    return asyncio.run(fetch_reserves_multi(deployments, max_concurrency))
+
+
+class ReserveCache:
+    """
+    TTL cache around get_reserves with stale-while-revalidate and an on-disk snapshot.
+    The first get() starts from the last good Parquet snapshot when there is one
+    and only blocks on the subgraph when there is none. Once the data is older
+    than `ttl` seconds, get() keeps returning it and refreshes in a background
+    thread; a failed or empty refresh never replaces the last good table and
+    the next one is not tried before a backoff (`retry` seconds, doubling per
+    consecutive failure up to `ttl`).
+    Each load is stale after `ttl` plus a random share of up to `jitter` *
+    `ttl` seconds, drawn again per load and per forked process, so workers
+    that inherit the same table do not all refresh at once.
+    """
+
+    def __init__(self, loader=None, ttl=RESERVE_CACHE_TTL, snapshot_path=RESERVE_SNAPSHOT_PATH,
+                 retry=RESERVE_CACHE_RETRY, jitter=RESERVE_CACHE_JITTER):
+        self.loader = loader
+        self.ttl = ttl
+        self.retry = retry
+        self.jitter = jitter
+        self._stale_after = ttl
+        self.snapshot_path = snapshot_path
+        self.version = 0
+        self.fingerprint = None
+        self._df = None
+        self._loaded_at = 0.0
+        self._failures = 0
+        self._retry_at = 0.0
+        self._lock = threading.Lock()
+        self._refreshing = False
+        if hasattr(os, "register_at_fork"):
+            # A refresh thread running in the parent (e.g. the gunicorn master)
+            # does not exist in a forked worker; start from a clean state there
+            os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def _reset_after_fork(self):
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._draw_stale_after()
+
+    def _draw_stale_after(self):
+        self._stale_after = self.ttl * (1 + random.uniform(0, self.jitter))
+
+    def get(self):
+        requests_total = metrics.counter("reserve_cache_requests_total", "Reserve cache lookups by result")
+        if self._df is None:
+            with self._lock:
+                if self._df is None:
+                    requests_total.labels(result="miss").inc()
+                    self._load_initial()
+        if self.is_stale():
+            requests_total.labels(result="stale").inc()
+            if time.time() >= self._retry_at:
+                self.refresh_async()
+        else:
+            requests_total.labels(result="hit").inc()
+        return self._df
+
+    def is_stale(self):
+        return time.time() - self._loaded_at > self._stale_after
+
+    def _load_initial(self):
+        snapshot = self.load_snapshot()
+        if snapshot is not None:
+            self._set(snapshot, os.path.getmtime(self.snapshot_path))
+            return
+        try:
+            self._refresh()
+        except Exception:
+            logger.exception("Initial reserve fetch failed")
+        if self._df is None:
+            self._set(pd.DataFrame(columns=["symbol", "totalLiquidity", "totalBorrows",
+                                            "liquidationThreshold", "Price"]), 0.0)
+
+    def _set(self, df, loaded_at):
+        self._df = df
+        self._loaded_at = loaded_at
+        self._draw_stale_after()
+        self.version += 1
+        # version counts loads in this process; the fingerprint is the same in
+        # every process that holds the same table
+        self.fingerprint = hashlib.md5(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes()).hexdigest()
+
+    def _refresh(self):
+        loader = self.loader or get_reserves
+        try:
+            with metrics.timed("reserve_fetch_duration_seconds", "Reserve table fetch duration"):
+                df = loader()
+        except Exception:
+            self._back_off()
+            raise
+        if df is None or df.empty:
+            self._back_off()
+            logger.warning("Reserve refresh returned no data, keeping previous table")
+            return
+        self._failures = 0
+        self._retry_at = 0.0
+        self._set(df, time.time())
+        self.save_snapshot(df)
+
+    def _back_off(self):
+        self._failures += 1
+        delay = min(self.retry * 2 ** (self._failures - 1), max(self.ttl, self.retry))
+        self._retry_at = time.time() + delay
+        logger.warning("Reserve refresh failed %d time(s) in a row, next attempt in %.1fs", self._failures, delay)
+
+    def refresh(self):
+        with self._lock:
+            self._refresh()
+
+    def refresh_async(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._refresh_in_background, daemon=True).start()
+
+    def _refresh_in_background(self):
+        try:
+            self.refresh()
+        except Exception:
+            logger.exception("Background reserve refresh failed")
+        finally:
+            self._refreshing = False
+
+    def load_snapshot(self):
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return None
+        try:
+            return pd.read_parquet(self.snapshot_path)
+        except Exception:
+            logger.exception("Could not read reserve snapshot %s", self.snapshot_path)
+            return None
+
+    def save_snapshot(self, df):
+        if not self.snapshot_path:
+            return
+        # Write next to the target and swap, so readers never see a partial file
+        tmp_path = f"{self.snapshot_path}.{os.getpid()}.tmp"
+        try:
+            df.reset_index(drop=True).to_parquet(tmp_path, index=False)
+            os.replace(tmp_path, self.snapshot_path)
+        except Exception:
+            logger.exception("Could not write reserve snapshot %s", self.snapshot_path)
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
@@ -0,0 +1,24 @@
+# ------------------------- gunicorn.conf.py -------------------------
+#   gunicorn -c gunicorn.conf.py
+#
+# The app is imported once in the master (preload_app) and warm_up() loads
+# the reserve table there (from the on-disk snapshot when there is one), so
+# workers fork with the imports and the table already in memory: a new or
+# restarted worker boots without network access or import cost.
+# Workers share portfolios through the store's spill directory (see app.py),
+# so with several workers every portfolio is written through to it; with
+# PORTFOLIO_STORE_SPILL_DIR="" run a single worker (WEB_CONCURRENCY=1).
+import os
+
+wsgi_app = "app:server"
+bind = os.environ.get("BIND", "0.0.0.0:8050")
+workers = int(os.environ.get("WEB_CONCURRENCY", 2))
+if workers > 1:
+    os.environ.setdefault("PORTFOLIO_STORE_WRITE_THROUGH", "1")  # read when the app is preloaded
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 60))
+preload_app = True
+
+
+def when_ready(server):
+    import app
+    server.log.info("app imported in %.2fs, warm-up took %.2fs", app.import_seconds, app.warm_up())
@@ -0,0 +1,128 @@
+# ------------------------- liquidation_index.py -------------------------
+# Sorted per-asset liquidation prices for "who liquidates at price P" queries
+from bisect import bisect_left, bisect_right
+
+import numpy as np
+
+from calculations import liquidation_prices
+
+
+class _SortedPrices:
+    """Liquidation prices of one asset and trigger side, sorted, with the owning accounts."""
+
+    def __init__(self, prices=None, accounts=None):
+        self.prices = prices or []
+        self.accounts = accounts or []
+
+    def insert(self, price, account):
+        i = bisect_right(self.prices, price)
+        self.prices.insert(i, price)
+        self.accounts.insert(i, account)
+
+    def remove(self, price, account):
+        i = bisect_left(self.prices, price)
+        while i < len(self.prices) and self.prices[i] == price:
+            if self.accounts[i] == account:
+                del self.prices[i]
+                del self.accounts[i]
+                return
+            i += 1
+
+    def at_or_above(self, price):
+        return self.accounts[bisect_left(self.prices, price):]
+
+    def at_or_below(self, price):
+        return self.accounts[:bisect_right(self.prices, price)]
+
+    def between(self, low, high):
+        return self.accounts[bisect_left(self.prices, low):bisect_right(self.prices, high)]
+
+    def __len__(self):
+        return len(self.prices)
+
+
+class LiquidationIndex:
+    """
+    Per-asset sorted liquidation prices of a book of portfolios.
+    Built from liquidation_prices: every (account, asset) with a break-even
+    price is kept in one of two sorted arrays, depending on whether the account
+    goes under HF 1 when the price falls below it ("below", net collateral) or
+    rises above it ("above", net debt). Accounts that stay under HF 1 at any
+    price of the asset are kept in a per-asset set. Queries are bisect lookups
+    and assume only that one asset's price moves.
+    """
+
+    def __init__(self):
+        self._books = {}      # (symbol, trigger) -> _SortedPrices
+        self._always = {}     # symbol -> accounts under HF 1 at any price of it
+        self._entries = {}    # account -> [(symbol, trigger, price)]
+
+    @classmethod
+    def from_positions(cls, df_positions, account_col="account"):
+        return cls.from_liquidation_prices(liquidation_prices(df_positions, account_col), account_col)
+
+    @classmethod
+    def from_liquidation_prices(cls, df_liq, account_col="account"):
+        index = cls()
+        always = df_liq[df_liq["Trigger"] == "always"]
+        for symbol, group in always.groupby("symbol", sort=False):
+            accounts = group[account_col].tolist()
+            index._always[symbol] = set(accounts)
+            for account in accounts:
+                index._entries.setdefault(account, []).append((symbol, "always", np.nan))
+
+        df_liq = df_liq.dropna(subset=["Liquidation_Price"]).sort_values("Liquidation_Price", kind="stable")
+        for (symbol, trigger), group in df_liq.groupby(["symbol", "Trigger"], sort=False):
+            prices = group["Liquidation_Price"].tolist()
+            accounts = group[account_col].tolist()
+            index._books[(symbol, trigger)] = _SortedPrices(prices, accounts)
+            for account, price in zip(accounts, prices):
+                index._entries.setdefault(account, []).append((symbol, trigger, price))
+        return index
+
+    def insert(self, account, symbol, price, trigger):
+        if trigger == "always":
+            self._always.setdefault(symbol, set()).add(account)
+            self._entries.setdefault(account, []).append((symbol, trigger, np.nan))
+            return
+        if trigger is None or price is None or np.isnan(price):
+            return
+        self._books.setdefault((symbol, trigger), _SortedPrices()).insert(price, account)
+        self._entries.setdefault(account, []).append((symbol, trigger, price))
+
+    def remove_account(self, account):
+        for symbol, trigger, price in self._entries.pop(account, []):
+            if trigger == "always":
+                self._always[symbol].discard(account)
+            else:
+                self._books[(symbol, trigger)].remove(price, account)
+
+    def update_account(self, account, df_account_liq):
+        """Replace an account's entries with its fresh liquidation_prices rows."""
+        self.remove_account(account)
+        for rec in df_account_liq.to_dict(orient="records"):
+            self.insert(account, rec["symbol"], rec["Liquidation_Price"], rec["Trigger"])
+
+    def _book(self, symbol, trigger):
+        return self._books.get((symbol, trigger), _SortedPrices())
+
+    def accounts_liquidated_at(self, symbol, price):
+        """Accounts under HF 1 if `symbol` trades at `price`."""
+        return (
+            self._book(symbol, "below").at_or_above(price)
+            + self._book(symbol, "above").at_or_below(price)
+            + list(self._always.get(symbol, ()))
+        )
+
+    def accounts_between(self, symbol, low, high):
+        """Accounts whose liquidation price for `symbol` lies in [low, high]."""
+        return self._book(symbol, "below").between(low, high) + self._book(symbol, "above").between(low, high)
+
+    def liquidation_price(self, account, symbol):
+        for entry_symbol, trigger, price in self._entries.get(account, []):
+            if entry_symbol == symbol and trigger != "always":
+                return price
+        return None
+
+    def __len__(self):
+        return sum(len(book) for book in self._books.values())
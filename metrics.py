@@ -0,0 +1,157 @@
+# ------------------------- metrics.py -------------------------
+# Lightweight in-process metrics with a Prometheus text /metrics endpoint.
+# Observations are a lock plus a bisect into fixed buckets, cheap enough to
+# leave on in production. Metrics are per process: with several gunicorn
+# workers each worker reports its own numbers.
+import functools
+import threading
+import time
+from bisect import bisect_left
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+
+class Counter:
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class _Family:
+    def __init__(self, name, help_text, kind, buckets=None):
+        self.name = name
+        self.help = help_text
+        self.kind = kind
+        self.buckets = buckets
+        self.children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, **labels):
+        key = tuple(sorted(labels.items()))
+        child = self.children.get(key)
+        if child is None:
+            with self._lock:
+                child = self.children.get(key)
+                if child is None:
+                    child = Histogram(self.buckets) if self.kind == "histogram" else Counter()
+                    self.children[key] = child
+        return child
+
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+def _family(name, help_text, kind, buckets=None):
+    family = _registry.get(name)
+    if family is None:
+        with _registry_lock:
+            family = _registry.setdefault(name, _Family(name, help_text, kind, buckets))
+    return family
+
+
+def histogram(name, help_text="", buckets=DEFAULT_BUCKETS):
+    return _family(name, help_text, "histogram", buckets)
+
+
+def counter(name, help_text=""):
+    return _family(name, help_text, "counter")
+
+
+class timed:
+    """
+    Observe the wall time of a block or function in a histogram family.
+        with timed("stage_duration_seconds", stage="stress"): ...
+        @timed("dash_callback_duration_seconds", callback="calculate_portfolio")
+    """
+
+    def __init__(self, name, help_text="", **labels):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        histogram(self.name, self.help).labels(**self.labels).observe(time.perf_counter() - self._start)
+        return False
+
+    def __call__(self, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed(self.name, self.help, **self.labels):
+                return func(*args, **kwargs)
+        return wrapper
+
+
+def _format_labels(labels, extra=None):
+    items = list(labels) + (list(extra.items()) if extra else [])
+    if not items:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in items)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(items, escaped)) + "}"
+
+
+def render_prometheus():
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    for family in sorted(_registry.values(), key=lambda f: f.name):
+        if family.help:
+            lines.append(f"# HELP {family.name} {family.help}")
+        lines.append(f"# TYPE {family.name} {family.kind}")
+        for labels, child in sorted(family.children.items()):
+            if family.kind == "counter":
+                lines.append(f"{family.name}{_format_labels(labels)} {child.value}")
+                continue
+            cumulative = 0
+            for bound, count in zip((*family.buckets, "+Inf"), child.counts):
+                cumulative += count
+                lines.append(f"{family.name}_bucket{_format_labels(labels, {'le': bound})} {cumulative}")
+            lines.append(f"{family.name}_sum{_format_labels(labels)} {child.sum}")
+            lines.append(f"{family.name}_count{_format_labels(labels)} {child.count}")
+    return "\n".join(lines) + "\n"
+
+
+def install(server):
+    """Add GET /metrics and Dash callback payload size tracking to a Flask server."""
+    import flask
+
+    @server.route("/metrics")
+    def metrics_endpoint():
+        return flask.Response(render_prometheus(), mimetype="text/plain; version=0.0.4")
+
+    @server.after_request
+    def track_callback_payloads(response):
+        if flask.request.path.endswith("/_dash-update-component"):
+            body = flask.request.get_json(silent=True, cache=True) or {}
+            output = str(body.get("output", "unknown"))
+            histogram("dash_callback_request_bytes", "Dash callback request body size",
+                      SIZE_BUCKETS).labels(output=output).observe(flask.request.content_length or 0)
+            histogram("dash_callback_response_bytes", "Dash callback response body size",
+                      SIZE_BUCKETS).labels(output=output).observe(response.calculate_content_length() or 0)
+        return response
+
+    return server
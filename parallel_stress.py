@@ -0,0 +1,149 @@
+# ------------------------- parallel_stress.py -------------------------
+# (accounts x scenarios) stress grid sharded over a process pool.
+#
+# Positions are laid out as a CompactPortfolio sorted by account and placed,
+# together with the per-scenario reserve prices, in multiprocessing shared
+# memory. Workers get only (row range, account range) tuples, compute HF and
+# LTV for their accounts under every scenario and write them straight into a
+# shared output matrix, so no DataFrame is pickled in either direction.
+# Scenarios use the slider semantics of stress_test_calculation_multiple.
+import os
+from multiprocessing import get_context, shared_memory
+
+import numpy as np
+import pandas as pd
+
+from calculations import stress_price_factors
+from positions import CompactPortfolio, ReserveTable
+from risk_math import health_factor, loan_to_value
+
+SCENARIO_BLOCK_CELLS = 4_000_000  # scenario rows x positions evaluated at once per worker
+
+_shared = {}
+
+
+def _attach(specs):
+    """Pool initializer: map the shared arrays described by `specs` into this process."""
+    for name, (shm_name, shape, dtype) in specs.items():
+        shm = shared_memory.SharedMemory(name=shm_name)  # the parent unlinks the segments
+        _shared[name] = (shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf))
+
+
+def _stress_shard(bounds):
+    """HF / LTV of the accounts in `bounds` under every scenario, written to the shared output."""
+    start, stop, first_account, last_account = bounds
+    arrays = {name: array for name, (_, array) in _shared.items()}
+    symbol = arrays["symbol"][start:stop]
+    is_borrow = arrays["is_borrow"][start:stop]
+    amount = arrays["amount"][start:stop]
+    offsets = arrays["starts"][first_account:last_account] - start
+    empty = arrays["counts"][first_account:last_account] == 0
+
+    deposit = np.where(is_borrow, 0.0, amount)
+    deposit_adjusted = deposit * arrays["threshold"][symbol]
+    borrow = np.where(is_borrow, amount, 0.0)
+
+    prices = arrays["prices"]
+    n_scenarios = prices.shape[0]
+    block = max(1, SCENARIO_BLOCK_CELLS // max(len(amount), 1))
+    for s0 in range(0, n_scenarios, block):
+        s1 = min(s0 + block, n_scenarios)
+        price = prices[s0:s1][:, symbol]
+        collateral = np.add.reduceat(price * deposit, offsets, axis=1)
+        adjusted = np.add.reduceat(price * deposit_adjusted, offsets, axis=1)
+        debt = np.add.reduceat(price * borrow, offsets, axis=1)
+        collateral[:, empty] = adjusted[:, empty] = debt[:, empty] = 0.0
+
+        arrays["hf"][s0:s1, first_account:last_account] = np.round(health_factor(adjusted, debt), 3)
+        arrays["ltv"][s0:s1, first_account:last_account] = np.round(loan_to_value(debt, collateral), 3)
+
+
+def _shards(starts, counts, n_positions, n_shards):
+    """Split accounts into up to `n_shards` contiguous groups of roughly equal position counts."""
+    cuts = np.searchsorted(starts, np.linspace(0, n_positions, n_shards + 1)[1:-1], side="left")
+    edges = np.unique(np.concatenate([[0], cuts, [len(starts)]]))
+    ends = starts + counts
+    return [
+        (int(starts[a]), int(ends[b - 1]), int(a), int(b))
+        for a, b in zip(edges[:-1], edges[1:])
+        if b > a
+    ]
+
+
+def stress_grid(positions, scenarios, reserves=None, account_col="account", processes=None,
+                shards_per_process=4):
+    """
+    HF and LTV of every account under every scenario.
+    `positions` is a CompactPortfolio or a long positions table (then `reserves`
+    is the reserve DataFrame); `scenarios` maps a name to slider-style inputs
+    such as {"supply-ETH": 30}, or is a list of them (named by position).
+    Returns a DataFrame indexed by account with HF_<name> and LTV_<name> columns.
+    processes=1 runs in-process; None uses every CPU.
+    """
+    if not isinstance(positions, CompactPortfolio):
+        positions = CompactPortfolio.from_frame(positions, ReserveTable.from_frame(reserves), account_col)
+    if not isinstance(scenarios, dict):
+        scenarios = dict(enumerate(scenarios))
+    names = list(scenarios)
+
+    table = positions.reserves
+    # Trailing zero column so unknown symbols (code -1) are valued at 0
+    prices = np.zeros((len(names), len(table) + 1))
+    prices[:, :-1] = table.price
+    for i, name in enumerate(names):
+        for symbol, factor in stress_price_factors(scenarios[name]).items():
+            code = table.index.get_indexer([symbol])[0]
+            if code >= 0:
+                prices[i, code] *= factor
+
+    order = np.argsort(positions.account, kind="stable")
+    n_accounts = positions.n_accounts
+    account = positions.account[order]
+    counts = np.bincount(account, minlength=n_accounts)
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]]).astype(np.int64)
+
+    arrays = {
+        "symbol": positions.symbol[order],
+        "is_borrow": positions.is_borrow[order],
+        "amount": positions.amount[order],
+        "threshold": np.append(table.liquidation_threshold, 0.0),
+        "prices": prices,
+        "starts": starts,
+        "counts": counts,
+        "hf": np.zeros((len(names), n_accounts)),
+        "ltv": np.zeros((len(names), n_accounts)),
+    }
+
+    processes = processes or os.cpu_count() or 1
+    shards = _shards(starts, counts, len(order), processes * shards_per_process if processes > 1 else 1)
+    segments, specs = {}, {}
+    try:
+        for name, array in arrays.items():
+            shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            segments[name] = shm
+            np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+            specs[name] = (shm.name, array.shape, array.dtype)
+
+        if processes == 1:
+            for name, (_, shape, dtype) in specs.items():
+                _shared[name] = (segments[name], np.ndarray(shape, dtype=dtype, buffer=segments[name].buf))
+            for shard in shards:
+                _stress_shard(shard)
+        else:
+            with get_context().Pool(processes, initializer=_attach, initargs=(specs,)) as pool:
+                pool.map(_stress_shard, shards, chunksize=1)
+
+        hf = np.ndarray(arrays["hf"].shape, dtype=np.float64, buffer=segments["hf"].buf).copy()
+        ltv = np.ndarray(arrays["ltv"].shape, dtype=np.float64, buffer=segments["ltv"].buf).copy()
+    finally:
+        _shared.clear()
+        for shm in segments.values():
+            shm.close()
+            shm.unlink()
+
+    columns = {}
+    for i, name in enumerate(names):
+        columns[f"HF_{name}"] = hf[i]
+        columns[f"LTV_{name}"] = ltv[i]
+    return pd.DataFrame(columns, index=pd.Index(positions.accounts, name=account_col))
+
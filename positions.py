@@ -0,0 +1,147 @@
+# ------------------------- positions.py -------------------------
+# Compact columnar portfolio representation shared by the calculations
+import numpy as np
+import pandas as pd
+
+CHAIN_SEPARATOR = ":"
+
+
+def reserve_keys(df):
+    """
+    Reserve key of every row: the symbol, or "chain:symbol" when the table has
+    a chain column (fetch_data.fetch_reserves_multi), so one asset listed on
+    two chains stays two reserves. Rows without a chain keep the bare symbol.
+    """
+    symbols = df["symbol"]
+    if "chain" not in df.columns:
+        return symbols
+    keyed = df["chain"].astype(str) + CHAIN_SEPARATOR + symbols.astype(str)
+    return keyed.where(df["chain"].notna() & symbols.notna(), symbols).rename("symbol")
+
+
+class ReserveTable:
+    """
+    Per-reserve arrays shared by every portfolio built on it, keyed by
+    reserve_keys (the symbol, or "chain:symbol" for multi-chain tables).
+    Positions refer to rows by integer code instead of carrying merged copies
+    of the reserve columns; `extra` holds further float columns such as
+    totalLiquidity.
+    """
+
+    def __init__(self, symbols, price, liquidation_threshold, extra=None):
+        self.index = pd.Index(symbols)
+        self.price = np.ascontiguousarray(price, dtype=np.float64)
+        self.liquidation_threshold = np.ascontiguousarray(liquidation_threshold, dtype=np.float64)
+        self.extra = {name: np.ascontiguousarray(values, dtype=np.float64) for name, values in (extra or {}).items()}
+
+    @classmethod
+    def from_frame(cls, df_reserves):
+        keys = reserve_keys(df_reserves)
+        unique = ~keys.duplicated().to_numpy()
+        df_reserves, keys = df_reserves[unique], keys[unique]
+        extra = {c: pd.to_numeric(df_reserves[c], errors="coerce").fillna(0).to_numpy()
+                 for c in ("totalLiquidity", "totalBorrows") if c in df_reserves.columns}
+        return cls(
+            keys.to_numpy(),
+            pd.to_numeric(df_reserves["Price"], errors="coerce").fillna(0).to_numpy(),
+            pd.to_numeric(df_reserves["liquidationThreshold"], errors="coerce").fillna(0).to_numpy(),
+            extra,
+        )
+
+    @property
+    def symbols(self):
+        return self.index.to_numpy()
+
+    def codes(self, symbols):
+        """Integer code per reserve key, -1 for keys without a reserve."""
+        return self.index.get_indexer(pd.Index(symbols)).astype(np.int32)
+
+    def with_prices(self, factors):
+        """Copy with prices scaled by {reserve key: factor}; thresholds and extras are shared."""
+        price = self.price.copy()
+        for symbol, factor in factors.items():
+            code = self.index.get_indexer([symbol])[0]
+            if code >= 0:
+                price[code] *= factor
+        return ReserveTable(self.index, price, self.liquidation_threshold, self.extra)
+
+    def __len__(self):
+        return len(self.index)
+
+
+class CompactPortfolio:
+    """
+    One or many portfolios as contiguous arrays over a shared ReserveTable.
+    symbol holds reserve codes (-1 = unknown symbol, valued at 0 like a failed
+    merge), is_borrow the side flag, amount the float64 amounts and account
+    the account codes into `accounts`.
+    """
+
+    def __init__(self, reserves, symbol, is_borrow, amount, account=None, accounts=None):
+        self.reserves = reserves
+        self.symbol = np.ascontiguousarray(symbol, dtype=np.int32)
+        self.is_borrow = np.ascontiguousarray(is_borrow, dtype=bool)
+        self.amount = np.ascontiguousarray(amount, dtype=np.float64)
+        if account is None:
+            account, accounts = np.zeros(len(self.amount), dtype=np.int32), np.zeros(1, dtype=np.int64)
+        self.account = np.ascontiguousarray(account, dtype=np.int32)
+        self.accounts = np.asarray(accounts)
+
+    @classmethod
+    def from_frame(cls, df_positions, reserves, account_col=None):
+        """From a long positions table with symbol (and optionally chain), Type and Amount columns."""
+        account, accounts = (None, None)
+        if account_col:
+            account, accounts = pd.factorize(df_positions[account_col])
+        return cls(
+            reserves,
+            reserves.codes(reserve_keys(df_positions)),
+            (df_positions["Type"] == "Borrow").to_numpy(),
+            pd.to_numeric(df_positions["Amount"], errors="coerce").fillna(0).to_numpy(),
+            account,
+            accounts,
+        )
+
+    def _lookup(self, values):
+        return np.where(self.symbol >= 0, values[np.maximum(self.symbol, 0)], 0.0) if len(values) else np.zeros(len(self))
+
+    def price(self):
+        return self._lookup(self.reserves.price)
+
+    def liquidation_threshold(self):
+        return self._lookup(self.reserves.liquidation_threshold)
+
+    def values(self):
+        return self.price() * self.amount
+
+    def with_reserves(self, reserves):
+        """Same positions valued against another reserve table (same symbol codes)."""
+        return CompactPortfolio(reserves, self.symbol, self.is_borrow, self.amount, self.account, self.accounts)
+
+    @property
+    def n_accounts(self):
+        return len(self.accounts)
+
+    @property
+    def nbytes(self):
+        return self.symbol.nbytes + self.is_borrow.nbytes + self.amount.nbytes + self.account.nbytes
+
+    def to_frame(self):
+        """Expanded DataFrame in the layout general_calc produces; symbol holds the reserve key."""
+        symbols = np.append(self.reserves.symbols, None)
+        price = self.price()
+        threshold = self.liquidation_threshold()
+        value = price * self.amount
+        return pd.DataFrame({
+            "account": self.accounts[self.account],
+            "symbol": symbols[self.symbol],
+            "Type": pd.Categorical.from_codes(self.is_borrow.astype(np.int8), ["Deposit", "Borrow"]),
+            "Amount": self.amount,
+            "Price": price,
+            "liquidationThreshold": threshold,
+            "Total_Value": value,
+            "Total_Value_Adjusted_Collateral": value * threshold,
+        })
+
+    def __len__(self):
+        return len(self.amount)
@@ -0,0 +1,191 @@
+# ------------------------- price_history.py -------------------------
+# Append-only on-disk price / liquidation threshold history and a backtester.
+#
+# Every symbol is a directory with three raw little-endian columns:
+#   timestamp.i8 (unix seconds, strictly increasing), price.f8, threshold.f8
+# Appends write to the end of the files; reads are np.memmap views, so only
+# the pages a query touches are loaded. A partially written append (crash
+# between files) is ignored by trimming to the shortest column.
+#
+#   history = PriceHistory("history")
+#   history.append_reserves(get_reserves(), time.time())   # e.g. from a cron job
+#   backtest(history, df_positions, start="2024-01-01", step=60)
+import os
+from urllib.parse import quote, unquote
+
+import numpy as np
+import pandas as pd
+
+from risk_math import health_factor, loan_to_value
+
+COLUMNS = {"timestamp": np.dtype("<i8"), "price": np.dtype("<f8"), "threshold": np.dtype("<f8")}
+FILE_NAMES = {"timestamp": "timestamp.i8", "price": "price.f8", "threshold": "threshold.f8"}
+
+
+def to_seconds(value):
+    """Unix seconds from an int/float, a datetime-like or a date string (UTC)."""
+    if isinstance(value, (int, np.integer, float, np.floating)):
+        return int(value)
+    ts = pd.Timestamp(value)
+    if ts.tzinfo is None:
+        ts = ts.tz_localize("UTC")
+    return int(ts.timestamp())
+
+
+class PriceHistory:
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, symbol, column):
+        return os.path.join(self.root, quote(symbol, safe=""), FILE_NAMES[column])
+
+    def symbols(self):
+        return sorted(unquote(name) for name in os.listdir(self.root)
+                      if os.path.isdir(os.path.join(self.root, name)))
+
+    def __len__(self):
+        return len(self.symbols())
+
+    def series(self, symbol):
+        """Read-only memmaps (timestamp, price, threshold) of one symbol; empty arrays if unknown."""
+        sizes = []
+        for column, dtype in COLUMNS.items():
+            path = self._path(symbol, column)
+            sizes.append(os.path.getsize(path) // dtype.itemsize if os.path.exists(path) else 0)
+        n = min(sizes)
+        if n == 0:
+            return tuple(np.empty(0, dtype=dtype) for dtype in COLUMNS.values())
+        return tuple(np.memmap(self._path(symbol, column), dtype=dtype, mode="r", shape=(n,))
+                     for column, dtype in COLUMNS.items())
+
+    def last_timestamp(self, symbol):
+        timestamps = self.series(symbol)[0]
+        return int(timestamps[-1]) if len(timestamps) else None
+
+    def append(self, symbol, timestamps, prices, thresholds):
+        """Append observations of one symbol; timestamps must be increasing and after the stored ones."""
+        timestamps = np.atleast_1d(np.asarray(timestamps, dtype=COLUMNS["timestamp"]))
+        values = {
+            "timestamp": timestamps,
+            "price": np.broadcast_to(np.asarray(prices, dtype=COLUMNS["price"]), timestamps.shape),
+            "threshold": np.broadcast_to(np.asarray(thresholds, dtype=COLUMNS["threshold"]), timestamps.shape),
+        }
+        if len(timestamps) == 0:
+            return 0
+        last = self.last_timestamp(symbol)
+        if np.any(np.diff(timestamps) <= 0) or (last is not None and timestamps[0] <= last):
+            raise ValueError(f"timestamps for {symbol} must be strictly increasing and after {last}")
+
+        os.makedirs(os.path.dirname(self._path(symbol, "timestamp")), exist_ok=True)
+        n = len(self.series(symbol)[0])
+        for column in ("price", "threshold", "timestamp"):  # timestamps last: they define what is visible
+            with open(self._path(symbol, column), "ab") as f:
+                # Drop the tail of an earlier torn append before writing
+                f.truncate(n * COLUMNS[column].itemsize)
+                f.write(np.ascontiguousarray(values[column]).tobytes())
+        return len(timestamps)
+
+    def append_reserves(self, df_reserves, timestamp):
+        """Append one observation per reserve row (symbol, Price, liquidationThreshold) at `timestamp`."""
+        ts = to_seconds(timestamp)
+        written = 0
+        for symbol, price, threshold in df_reserves[["symbol", "Price", "liquidationThreshold"]].itertuples(
+                index=False):
+            last = self.last_timestamp(symbol)
+            if last is None or ts > last:
+                written += self.append(symbol, [ts], price, threshold)
+        return written
+
+    def asof(self, symbol, times):
+        """Price and threshold of `symbol` at each of `times` (last observation at or before; NaN before the first)."""
+        timestamps, prices, thresholds = self.series(symbol)
+        idx = np.searchsorted(timestamps, times, side="right") - 1
+        known = idx >= 0
+        idx = np.maximum(idx, 0)
+        price = np.full(len(times), np.nan)
+        threshold = np.full(len(times), np.nan)
+        if len(timestamps):
+            price[known] = prices[idx[known]]
+            threshold[known] = thresholds[idx[known]]
+        return price, threshold
+
+
+def _holdings(df_positions):
+    """Deposit and borrow amounts per symbol of a single portfolio (symbol, Type, Amount)."""
+    amount = pd.to_numeric(df_positions["Amount"], errors="coerce").fillna(0)
+    sides = pd.DataFrame({
+        "symbol": df_positions["symbol"].to_numpy(),
+        "deposit": np.where(df_positions["Type"] == "Deposit", amount, 0.0),
+        "borrow": np.where(df_positions["Type"] == "Borrow", amount, 0.0),
+    })
+    return sides.groupby("symbol").sum()
+
+
+def backtest(history, df_positions, start=None, end=None, step=60, hf_thresholds=(1.0, 1.1, 1.5),
+             chunk_size=1_000_000, return_path=False):
+    """
+    Replay a portfolio with fixed amounts through the stored price history.
+    HF and LTV are evaluated on a regular grid of `step` seconds between
+    `start` and `end` (defaults: from when every held symbol has data to the
+    last observation), `chunk_size` grid points at a time, using the latest
+    observed price and threshold of every symbol at each point.
+
+    Returns a dict with min_hf (and its timestamp), the time spent with HF
+    below each of `hf_thresholds` in seconds, first_liquidation (first
+    timestamp with HF < 1, or None), the number of points and, with
+    return_path=True, a DataFrame of the full HF / LTV path.
+    """
+    holdings = _holdings(df_positions)
+    symbols = holdings.index.tolist()
+    series = {s: history.series(s)[0] for s in symbols}
+    missing = [s for s, timestamps in series.items() if len(timestamps) == 0]
+    if missing:
+        raise ValueError(f"no history for {', '.join(missing)}")
+
+    start = max(int(t[0]) for t in series.values()) if start is None else to_seconds(start)
+    end = max(int(t[-1]) for t in series.values()) if end is None else to_seconds(end)
+    n_points = max(0, (end - start) // step + 1)
+
+    report = {
+        "min_hf": np.inf, "min_hf_timestamp": None, "first_liquidation": None, "points": n_points,
+        "seconds_below": {threshold: 0 for threshold in hf_thresholds},
+    }
+    paths = []
+    for offset in range(0, n_points, chunk_size):
+        times = start + step * np.arange(offset, min(offset + chunk_size, n_points), dtype=np.int64)
+        collateral = np.zeros(len(times))
+        adjusted = np.zeros(len(times))
+        debt = np.zeros(len(times))
+        for symbol, (deposit, borrow) in holdings[["deposit", "borrow"]].iterrows():
+            price, threshold = history.asof(symbol, times)
+            collateral += deposit * price
+            adjusted += deposit * price * threshold
+            debt += borrow * price
+
+        hf = health_factor(adjusted, debt)
+        hf[np.isnan(debt) | np.isnan(adjusted)] = np.nan  # a held symbol has no price yet
+        ltv = loan_to_value(debt, collateral)
+
+        valid = ~np.isnan(hf)
+        if valid.any():
+            i = np.argmin(np.where(valid, hf, np.inf))
+            if report["min_hf_timestamp"] is None or hf[i] < report["min_hf"]:
+                report["min_hf"], report["min_hf_timestamp"] = float(hf[i]), int(times[i])
+        for threshold in hf_thresholds:
+            report["seconds_below"][threshold] += int(np.count_nonzero(hf < threshold)) * step
+        liquidated = np.flatnonzero(hf < 1)
+        if report["first_liquidation"] is None and len(liquidated):
+            report["first_liquidation"] = int(times[liquidated[0]])
+        if return_path:
+            paths.append(pd.DataFrame({"timestamp": times, "HF": hf, "LTV": ltv}))
+
+    report["min_hf"] = round(report["min_hf"], 3)
+    for key in ("min_hf_timestamp", "first_liquidation"):
+        if report[key] is not None:
+            report[key] = pd.Timestamp(report[key], unit="s", tz="UTC")
+    if return_path:
+        path = pd.concat(paths, ignore_index=True) if paths else pd.DataFrame(columns=["timestamp", "HF", "LTV"])
+        path["timestamp"] = pd.to_datetime(path["timestamp"], unit="s", utc=True)
+        report["path"] = path
+    return report
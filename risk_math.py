@@ -0,0 +1,28 @@
+# ------------------------- risk_math.py -------------------------
+# Array helpers shared by the risk modules (calculations, risk_rules,
+# risk_state, cascade, parallel_stress, price_history).
+import numpy as np
+import pandas as pd
+
+
+def numeric_column(df, column):
+    """`df[column]` as float64, with missing or non-numeric values as 0."""
+    return pd.to_numeric(df[column], errors="coerce").fillna(0).to_numpy(dtype=np.float64)
+
+
+def health_factor(collateral_adjusted, debt):
+    """Elementwise HF = adjusted collateral / debt, inf where there is no debt (unrounded)."""
+    collateral_adjusted, debt = np.broadcast_arrays(
+        np.asarray(collateral_adjusted, dtype=np.float64), np.asarray(debt, dtype=np.float64))
+    hf = np.full(debt.shape, np.inf)
+    np.divide(collateral_adjusted, debt, out=hf, where=debt != 0)
+    return hf
+
+
+def loan_to_value(debt, collateral):
+    """Elementwise LTV = debt / collateral, NaN where there is no collateral (unrounded)."""
+    debt, collateral = np.broadcast_arrays(
+        np.asarray(debt, dtype=np.float64), np.asarray(collateral, dtype=np.float64))
+    ltv = np.full(debt.shape, np.nan)
+    np.divide(debt, collateral, out=ltv, where=collateral != 0)
+    return ltv
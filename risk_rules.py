@@ -0,0 +1,105 @@
+# ------------------------- risk_rules.py -------------------------
+# Declarative position risk flags, evaluated as NumPy masks over whole tables.
+#
+# A rule is {"name", "metric", "op", "value"}: a position is flagged when
+# `metric op value` holds for any rule. Metrics are computed per row by
+# risk_metrics; a metric that does not apply to a row (e.g. borrow_ltv on a
+# deposit) is NaN there, and NaN never matches. The same DEFAULT_RULES drive
+# the Dash tables, calculations.evaluate_row_risk and batch runs.
+import operator
+
+import numpy as np
+import pandas as pd
+
+from risk_math import health_factor, numeric_column
+
+OPERATORS = {"<": operator.lt, "<=": operator.le, ">": operator.gt, ">=": operator.ge}
+
+DEFAULT_RULES = [
+    # HF of the whole portfolio (account) after stress: everything is at risk
+    {"name": "hf_below_one", "metric": "hf", "op": "<", "value": 1.0},
+    # Asset price dropped more than 10%
+    {"name": "price_drop", "metric": "price_ratio", "op": "<", "value": 0.90},
+    # Deposit worth almost nothing as collateral
+    {"name": "low_collateral", "metric": "adjusted_collateral_value", "op": "<", "value": 1.0},
+    # Borrow alone pushes LTV high
+    {"name": "high_ltv", "metric": "borrow_ltv", "op": ">", "value": 0.60},
+]
+
+METRICS = ("hf", "price_ratio", "adjusted_collateral_value", "borrow_ltv")
+
+
+def compile_rules(rules=DEFAULT_RULES):
+    """Turn rule dicts into (name, function(metrics) -> bool mask) pairs; bad rules fail here."""
+    compiled = []
+    for rule in rules:
+        metric, op, value = rule["metric"], rule["op"], float(rule["value"])
+        if metric not in METRICS:
+            raise ValueError(f"unknown metric {metric!r} in rule {rule.get('name')!r}")
+        if op not in OPERATORS:
+            raise ValueError(f"unknown operator {op!r} in rule {rule.get('name')!r}")
+        compare = OPERATORS[op]
+        compiled.append((rule.get("name", metric),
+                         lambda metrics, metric=metric, compare=compare, value=value: compare(metrics[metric], value)))
+    return compiled
+
+
+def evaluate_rules(metrics, rules=DEFAULT_RULES):
+    """Bool mask of rows matching any rule; `metrics` maps metric name to arrays or scalars."""
+    n = max((np.size(v) for v in metrics.values()), default=1)
+    flagged = np.zeros(n, dtype=bool)
+    with np.errstate(invalid="ignore"):
+        for _, mask in compile_rules(rules):
+            flagged |= np.broadcast_to(np.asarray(mask(metrics), dtype=bool), n)
+    return flagged
+
+
+def risk_metrics(df_after, price_before=None, account_col=None):
+    """
+    Rule metrics for every row of a stressed positions table (symbol, Type,
+    Amount, Price, liquidationThreshold). `price_before` holds the pre-stress
+    price of each row; HF and total collateral are per account when
+    `account_col` is given, else over the whole table.
+    """
+    n = len(df_after)
+    if account_col:
+        codes, accounts = pd.factorize(df_after[account_col])
+        codes, n_groups = np.maximum(codes, 0), max(len(accounts), 1)
+    else:
+        codes, n_groups = np.zeros(n, dtype=np.int64), 1
+
+    price = numeric_column(df_after, "Price")
+    value = price * numeric_column(df_after, "Amount")
+    adjusted = value * numeric_column(df_after, "liquidationThreshold")
+    types = df_after["Type"].to_numpy()
+    is_deposit, is_borrow = types == "Deposit", types == "Borrow"
+
+    collateral = np.bincount(codes, weights=np.where(is_deposit, value, 0.0), minlength=n_groups)
+    collateral_adjusted = np.bincount(codes, weights=np.where(is_deposit, adjusted, 0.0), minlength=n_groups)
+    debt = np.bincount(codes, weights=np.where(is_borrow, value, 0.0), minlength=n_groups)
+    hf = health_factor(collateral_adjusted, debt)
+
+    price_ratio = np.full(n, np.nan)
+    if price_before is not None:
+        before = pd.to_numeric(pd.Series(np.asarray(price_before)), errors="coerce").to_numpy(dtype=np.float64)
+        np.divide(price, before, out=price_ratio, where=before > 0)
+
+    total_collateral = collateral[codes]
+    borrow_ltv = np.where(is_borrow, 0.0, np.nan)
+    np.divide(value, total_collateral, out=borrow_ltv, where=is_borrow & (total_collateral > 0))
+
+    return {
+        "hf": np.round(hf, 3)[codes],
+        "price_ratio": price_ratio,
+        "adjusted_collateral_value": np.where(is_deposit, adjusted, np.nan),
+        "borrow_ltv": borrow_ltv,
+    }
+
+
+def flag_risk(df_after, price_before=None, account_col=None, rules=DEFAULT_RULES):
+    """Bool mask of risky rows of a stressed positions table; rows without a symbol are never flagged."""
+    if len(df_after) == 0:
+        return np.zeros(0, dtype=bool)
+    symbol = df_after["symbol"]
+    has_symbol = (symbol.notna() & (symbol.astype(str) != "")).to_numpy()
+    return evaluate_rules(risk_metrics(df_after, price_before, account_col), rules) & has_symbol
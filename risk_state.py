@@ -0,0 +1,101 @@
+# ------------------------- risk_state.py -------------------------
+# Incrementally maintained per-account HF for a book of positions
+import numpy as np
+import pandas as pd
+
+from positions import reserve_keys
+from risk_math import health_factor, numeric_column
+
+
+class RiskState:
+    """
+    Running per-account sums of adjusted collateral, collateral and debt.
+    Positions are grouped by symbol (the chain:symbol reserve key when the
+    table has a chain column), so a price update for one symbol only
+    touches the positions holding it and returns the accounts whose HF moved.
+    Sums are kept as float64 running totals; call resync() now and then to
+    drop accumulated rounding error.
+    """
+
+    def __init__(self, df_positions: pd.DataFrame, account_col="account"):
+        self.account_col = account_col
+        account_codes, self.accounts = pd.factorize(df_positions[account_col])
+        symbol_codes, symbols = pd.factorize(reserve_keys(df_positions))
+
+        amount = numeric_column(df_positions, "Amount")
+        threshold = numeric_column(df_positions, "liquidationThreshold")
+        is_deposit = (df_positions["Type"] == "Deposit").to_numpy()
+        is_borrow = (df_positions["Type"] == "Borrow").to_numpy()
+
+        # Positions sorted by symbol: every symbol owns one contiguous slice
+        order = np.argsort(symbol_codes, kind="stable")
+        self._account = account_codes[order]
+        self._units_adjusted = np.where(is_deposit, amount * threshold, 0.0)[order]
+        self._units_collateral = np.where(is_deposit, amount, 0.0)[order]
+        self._units_debt = np.where(is_borrow, amount, 0.0)[order]
+        bounds = np.searchsorted(symbol_codes[order], np.arange(len(symbols) + 1))
+        self._slices = {symbol: slice(bounds[i], bounds[i + 1]) for i, symbol in enumerate(symbols)}
+
+        price = numeric_column(df_positions, "Price")
+        first = np.unique(symbol_codes, return_index=True)[1]
+        self.prices = dict(zip(symbols, price[first]))
+        self.resync()
+
+    def resync(self):
+        """Recompute every account sum from the positions at current prices."""
+        price = np.zeros(len(self._account))
+        for symbol, positions in self._slices.items():
+            price[positions] = self.prices[symbol]
+        n = len(self.accounts)
+        self.collateral_adjusted = np.bincount(self._account, weights=self._units_adjusted * price, minlength=n)
+        self.collateral = np.bincount(self._account, weights=self._units_collateral * price, minlength=n)
+        self.debt = np.bincount(self._account, weights=self._units_debt * price, minlength=n)
+
+    def hf(self):
+        return pd.Series(np.round(health_factor(self.collateral_adjusted, self.debt), 3),
+                         index=pd.Index(self.accounts, name=self.account_col), name="HF")
+
+    def update_price(self, symbol, price):
+        return self.update_prices({symbol: price})
+
+    def update_prices(self, prices):
+        """
+        Apply new prices and return the HF delta of the affected accounts.
+        Only positions in the updated symbols are touched. The result has
+        HF_Before and HF_After (rounded like calculate_hf) for every account
+        whose HF changed.
+        """
+        touched = []
+        for symbol, price in prices.items():
+            positions = self._slices.get(symbol)
+            if positions is None:
+                continue
+            delta = price - self.prices[symbol]
+            self.prices[symbol] = price
+            if delta != 0 and positions.stop > positions.start:
+                touched.append((positions, delta))
+        if not touched:
+            return pd.DataFrame(columns=["HF_Before", "HF_After"], index=pd.Index([], name=self.account_col))
+
+        accounts = np.concatenate([self._account[positions] for positions, _ in touched])
+        affected, local = np.unique(accounts, return_inverse=True)
+        hf_before = health_factor(self.collateral_adjusted[affected], self.debt[affected])
+
+        n = len(affected)
+        delta_adjusted = np.bincount(local, weights=np.concatenate(
+            [self._units_adjusted[positions] * delta for positions, delta in touched]), minlength=n)
+        delta_collateral = np.bincount(local, weights=np.concatenate(
+            [self._units_collateral[positions] * delta for positions, delta in touched]), minlength=n)
+        delta_debt = np.bincount(local, weights=np.concatenate(
+            [self._units_debt[positions] * delta for positions, delta in touched]), minlength=n)
+        self.collateral_adjusted[affected] += delta_adjusted
+        self.collateral[affected] += delta_collateral
+        self.debt[affected] += delta_debt
+
+        hf_before = np.round(hf_before, 3)
+        hf_after = np.round(health_factor(self.collateral_adjusted[affected], self.debt[affected]), 3)
+        changed = hf_before != hf_after
+        return pd.DataFrame(
+            {"HF_Before": hf_before[changed], "HF_After": hf_after[changed]},
+            index=pd.Index(self.accounts[affected[changed]], name=self.account_col),
+        )
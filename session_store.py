@@ -0,0 +1,173 @@
+# ------------------------- session_store.py -------------------------
+# Server-side portfolio store so the browser only holds a small handle
+import hashlib
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+PORTFOLIO_STORE_MAX_MB = float(os.environ.get("PORTFOLIO_STORE_MAX_MB", 256))
+# Unset: the app picks its default directory; "" keeps portfolios in memory only
+PORTFOLIO_STORE_SPILL_DIR = os.environ.get("PORTFOLIO_STORE_SPILL_DIR")
+PORTFOLIO_STORE_SPILL_TTL = float(os.environ.get("PORTFOLIO_STORE_SPILL_TTL", 24 * 3600))
+PORTFOLIO_STORE_SPILL_MAX_MB = float(os.environ.get("PORTFOLIO_STORE_SPILL_MAX_MB", 1024))
+# "1": write every put through to the spill directory (needed with several workers)
+PORTFOLIO_STORE_WRITE_THROUGH = os.environ.get("PORTFOLIO_STORE_WRITE_THROUGH", "0") == "1"
+
+
+class PortfolioStore:
+    """
+    LRU store of portfolio DataFrames keyed by an opaque handle.
+    Memory is bounded by `max_bytes` (deep DataFrame size); least recently
+    used entries are dropped from memory first.
+
+    With `spill_dir` set, evicted entries are written there as Parquet and
+    get() reads through to it on a miss. A put() is only written at once
+    when asked for (`persist=True`, or `write_through` for every put): that
+    is what makes a handle visible to other processes sharing the directory
+    (gunicorn workers, background jobs). Spill files are deleted by
+    discard(), once older than `spill_ttl` seconds, and oldest first while
+    the directory holds more than `spill_max_bytes`.
+    Without a spill directory the store is private to one process: only use
+    that with a single worker, and an evicted handle simply misses.
+    """
+
+    def __init__(self, max_bytes=PORTFOLIO_STORE_MAX_MB * 1024 ** 2, spill_dir=PORTFOLIO_STORE_SPILL_DIR,
+                 spill_ttl=PORTFOLIO_STORE_SPILL_TTL, spill_max_bytes=PORTFOLIO_STORE_SPILL_MAX_MB * 1024 ** 2,
+                 write_through=PORTFOLIO_STORE_WRITE_THROUGH):
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir or None
+        self.spill_ttl = spill_ttl
+        self.spill_max_bytes = spill_max_bytes
+        self.write_through = write_through
+        self.nbytes = 0
+        self._entries = OrderedDict()  # handle -> (df, nbytes)
+        self._lock = threading.Lock()
+        if self.spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+
+    def _spill_path(self, handle):
+        return os.path.join(self.spill_dir, f"{handle}.parquet")
+
+    @staticmethod
+    def _valid(handle):
+        return isinstance(handle, str) and len(handle) == 32 and handle.isalnum()
+
+    @staticmethod
+    def content_handle(df):
+        """Handle derived from the DataFrame contents, equal for equal portfolios."""
+        digest = hashlib.md5(",".join(map(str, df.columns)).encode())
+        digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+        return digest.hexdigest()
+
+    def put(self, df, handle=None, persist=None):
+        """
+        Store `df` and return its handle (a new one unless `handle` is given).
+        With `persist` (default: the store's `write_through`) and a spill
+        directory it is also written there now, unless a file for the handle
+        already exists (content handles: same contents).
+        """
+        handle = handle if self._valid(handle) else uuid.uuid4().hex
+        persist = self.write_through if persist is None else persist
+        with self._lock:
+            self._cache(handle, df)
+            if persist and self.spill_dir and not os.path.exists(self._spill_path(handle)):
+                self._spill(handle, df)
+        return handle
+
+    def get(self, handle):
+        """The stored DataFrame, or None if the handle is unknown or expired."""
+        if not self._valid(handle):
+            return None
+        with self._lock:
+            entry = self._entries.get(handle)
+            if entry is not None:
+                self._entries.move_to_end(handle)
+                return entry[0]
+        if not self.spill_dir or not os.path.exists(self._spill_path(handle)):
+            return None
+        try:
+            df = pd.read_parquet(self._spill_path(handle))
+            os.utime(self._spill_path(handle))  # recently used files are pruned last
+        except Exception:
+            logger.exception("Could not load spilled portfolio %s", handle)
+            return None
+        with self._lock:
+            self._cache(handle, df)
+        return df
+
+    def discard(self, handle):
+        """Forget `handle` in memory and on disk."""
+        if not self._valid(handle):
+            return
+        with self._lock:
+            self._drop(handle)
+            if self.spill_dir and os.path.exists(self._spill_path(handle)):
+                os.remove(self._spill_path(handle))
+
+    def _cache(self, handle, df):
+        """Replace the in-memory entry of `handle`; the spill file is left alone."""
+        self._drop(handle)
+        size = int(df.memory_usage(deep=True).sum())
+        self._entries[handle] = (df, size)
+        self.nbytes += size
+        self._evict()
+
+    def _drop(self, handle):
+        entry = self._entries.pop(handle, None)
+        if entry is not None:
+            self.nbytes -= entry[1]
+
+    def _evict(self):
+        # Keep at least the newest entry even if it alone exceeds the budget
+        while self.nbytes > self.max_bytes and len(self._entries) > 1:
+            handle, (df, size) = self._entries.popitem(last=False)
+            self.nbytes -= size
+            if self.spill_dir and not os.path.exists(self._spill_path(handle)):
+                self._spill(handle, df)
+
+    def _spill(self, handle, df):
+        path = self._spill_path(handle)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        try:
+            df.to_parquet(tmp)
+            os.replace(tmp, path)  # readers in other processes never see partial files
+        except Exception:
+            logger.exception("Could not spill portfolio %s", handle)
+            return
+        self._prune_spill()
+
+    def _prune_spill(self):
+        """Delete spill files older than spill_ttl, then the oldest ones beyond spill_max_bytes."""
+        now = time.time()
+        files = []
+        for entry in os.scandir(self.spill_dir):
+            if not entry.name.endswith(".parquet"):
+                continue
+            try:
+                stat = entry.stat()
+                if now - stat.st_mtime > self.spill_ttl:
+                    os.remove(entry.path)
+                else:
+                    files.append((stat.st_mtime, stat.st_size, entry.path))
+            except FileNotFoundError:
+                pass  # removed by another process
+        # Like the memory budget, the newest file is kept even if it alone exceeds the cap
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files)[:-1]:
+            if total <= self.spill_max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,180 @@
+# ------------------------- shared_reserves.py -------------------------
+# Reserve table shared by every gunicorn worker through memory-mapped .npy files.
+#
+#   python shared_reserves.py --dir /dev/shm/defi-reserves           # refresher
+#   RESERVE_SHM_DIR=/dev/shm/defi-reserves gunicorn -c gunicorn.conf.py
+#
+# One refresher process fetches the reserves and publishes each table as a new
+# version directory of column files (v000000000001/Price.npy, ...), then points
+# the CURRENT file at it with os.replace, so readers switch versions
+# atomically. Workers map the current version read-only: the numeric columns
+# are shared page cache (on /dev/shm, shared memory), not per-worker copies,
+# and all workers see a new version within `check_interval` seconds.
+import argparse
+import logging
+import os
+import shutil
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+RESERVE_SHM_DIR = os.environ.get("RESERVE_SHM_DIR") or None
+RESERVE_COLUMNS = ["symbol", "totalLiquidity", "totalBorrows", "liquidationThreshold", "Price"]
+CURRENT = "CURRENT"
+
+
+def _version_name(version):
+    return f"v{version:012d}"
+
+
+def current_version(root):
+    """(version number, directory) that CURRENT points to, or (0, None)."""
+    try:
+        with open(os.path.join(root, CURRENT)) as f:
+            name = f.read().strip()
+    except FileNotFoundError:
+        return 0, None
+    return int(name[1:]), os.path.join(root, name)
+
+
+def publish(df, root, keep=3):
+    """Write `df` as the next version under `root` and make it current; returns the version."""
+    os.makedirs(root, exist_ok=True)
+    existing = [int(name[1:]) for name in os.listdir(root) if name.startswith("v") and name[1:].isdigit()]
+    version = max([current_version(root)[0], *existing], default=0) + 1
+    final_dir = os.path.join(root, _version_name(version))
+    tmp_dir = f"{final_dir}.{os.getpid()}.tmp"
+
+    os.makedirs(tmp_dir)
+    text = [c for c in df.columns if not pd.api.types.is_numeric_dtype(df[c])]
+    numeric = [c for c in df.columns if c not in text]
+    for column in text:
+        values = np.asarray(df[column].astype(str).to_numpy(), dtype=str)
+        np.save(os.path.join(tmp_dir, f"{column}.npy"), values, allow_pickle=False)
+    # All numeric columns in one Fortran-ordered matrix: a DataFrame can wrap
+    # it as a single block without copying
+    matrix = np.asfortranarray(df[numeric].to_numpy(dtype=np.float64))
+    np.save(os.path.join(tmp_dir, "numeric.npy"), matrix, allow_pickle=False)
+    with open(os.path.join(tmp_dir, "columns"), "w") as f:
+        f.write("\n".join(f"{c}\t{'text' if c in text else 'numeric'}" for c in df.columns))
+    os.rename(tmp_dir, final_dir)
+
+    pointer = os.path.join(root, f"{CURRENT}.{os.getpid()}.tmp")
+    with open(pointer, "w") as f:
+        f.write(_version_name(version))
+    os.replace(pointer, os.path.join(root, CURRENT))
+
+    # Readers that still map an old version keep their pages after the unlink
+    existing = sorted(existing)
+    for old in existing[:max(0, len(existing) - (keep - 1))]:
+        shutil.rmtree(os.path.join(root, _version_name(old)), ignore_errors=True)
+    return version
+
+
+def load_version(directory):
+    """DataFrame over one version directory; the numeric columns are a view of the mapped file."""
+    with open(os.path.join(directory, "columns")) as f:
+        kinds = dict(line.split("\t") for line in f.read().split("\n"))
+    numeric = [c for c, kind in kinds.items() if kind == "numeric"]
+    matrix = np.load(os.path.join(directory, "numeric.npy"), mmap_mode="r", allow_pickle=False)
+    df = pd.DataFrame(matrix, columns=numeric, copy=False)
+    for position, (column, kind) in enumerate(kinds.items()):
+        if kind == "text":
+            df.insert(position, column, np.load(os.path.join(directory, f"{column}.npy"), allow_pickle=False))
+    return df
+
+
+class SharedReserveTable:
+    """
+    Read side of the shared reserve table, a drop-in for fetch_data.ReserveCache
+    in the app (get(), version and fingerprint, here the published version
+    name, which every worker mapping `root` agrees on). get() checks CURRENT at most every
+    `check_interval` seconds and maps a new version when it changed; it never
+    fetches from the subgraph itself.
+    """
+
+    def __init__(self, root=RESERVE_SHM_DIR, check_interval=1.0):
+        self.root = root
+        self.check_interval = check_interval
+        self.version = 0
+        self.fingerprint = None
+        self._df = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def _reset_after_fork(self):
+        self._lock = threading.Lock()
+
+    def get(self):
+        now = time.monotonic()
+        if self._df is None or now - self._checked_at > self.check_interval:
+            with self._lock:
+                if self._df is None or now - self._checked_at > self.check_interval:
+                    self._checked_at = now
+                    self._check()
+        return self._df
+
+    def _check(self):
+        version, directory = current_version(self.root)
+        if version == self.version and self._df is not None:
+            return
+        if directory is None:
+            if self._df is None:
+                logger.warning("No reserve table published in %s yet", self.root)
+                self._df = pd.DataFrame(columns=RESERVE_COLUMNS)
+            return
+        try:
+            self._df = load_version(directory)
+            self.version = version
+            self.fingerprint = f"{os.path.abspath(self.root)}:{_version_name(version)}"
+        except Exception:
+            logger.exception("Could not map reserve table %s", directory)
+            if self._df is None:
+                self._df = pd.DataFrame(columns=RESERVE_COLUMNS)
+
+
+def run_refresher(root, interval, snapshot_path=None, once=False):
+    """Publish the reserve table every `interval` seconds (a failed or empty fetch keeps the last version)."""
+    from fetch_data import get_reserves
+
+    if snapshot_path and current_version(root)[1] is None and os.path.exists(snapshot_path):
+        # Give workers something to map before the first fetch completes
+        logger.info("Published snapshot %s as version %d", snapshot_path,
+                    publish(pd.read_parquet(snapshot_path), root))
+    while True:
+        started = time.monotonic()
+        try:
+            df = get_reserves()
+            if df is None or df.empty:
+                logger.warning("Reserve fetch returned no data, keeping the current version")
+            else:
+                logger.info("Published %d reserves as version %d", len(df), publish(df, root))
+        except Exception:
+            logger.exception("Reserve refresh failed")
+        if once:
+            return
+        time.sleep(max(0.0, interval - (time.monotonic() - started)))
+
+
+def main(argv=None):
+    from fetch_data import RESERVE_CACHE_TTL, RESERVE_SNAPSHOT_PATH
+
+    parser = argparse.ArgumentParser(description="Fetch reserves and publish them for the app workers.")
+    parser.add_argument("--dir", default=RESERVE_SHM_DIR or "/dev/shm/defi-reserves")
+    parser.add_argument("--interval", type=float, default=RESERVE_CACHE_TTL, help="seconds between fetches")
+    parser.add_argument("--snapshot", default=RESERVE_SNAPSHOT_PATH, help="Parquet snapshot to publish first")
+    parser.add_argument("--once", action="store_true", help="fetch and publish a single version")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    run_refresher(args.dir, args.interval, args.snapshot, args.once)
+
+
+if __name__ == "__main__":
+    main()
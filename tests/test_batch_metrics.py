@@ -0,0 +1,38 @@
+import math
+
+import pandas as pd
+
+from calculations import calculate_batch_metrics, calculate_hf, calculate_ltv, general_calc
+
+
+def _positions():
+    rows = [
+        # account, Type, symbol, Amount, Price, liquidationThreshold
+        ("a", "Deposit", "ETH", 10, 2000, 0.8),
+        ("a", "Deposit", "WBTC", 0.5, 60000, 0.75),
+        ("a", "Borrow", "USDC", 15000, 1, 0.0),
+        ("b", "Deposit", "ETH", 1, 2000, 0.8),
+        ("b", "Borrow", "DAI", 1900, 1, 0.0),
+        ("b", "Borrow", "USDC", 100, 1, 0.0),
+        ("c", "Deposit", "USDC", 5000, 1, 0.9),  # no debt: HF inf
+        ("d", "Borrow", "DAI", 10, 1, 0.0),  # no collateral: LTV undefined
+    ]
+    return pd.DataFrame(rows, columns=["account", "Type", "symbol", "Amount", "Price", "liquidationThreshold"])
+
+
+def test_batch_metrics_match_single_portfolio_functions():
+    positions = _positions()
+    batch = calculate_batch_metrics(positions)
+
+    assert list(batch.index) == ["a", "b", "c", "d"]
+    for account, rows in positions.groupby("account"):
+        single = general_calc(rows.copy())
+        assert batch.loc[account, "HF"] == calculate_hf(single)
+        ltv = calculate_ltv(single)
+        if ltv is None:
+            assert math.isnan(batch.loc[account, "LTV"])
+        else:
+            assert batch.loc[account, "LTV"] == ltv
+
+    assert batch.loc["c", "HF"] == float("inf")
+    assert calculate_hf(general_calc(positions[positions["account"] == "c"].copy())) == float("inf")
@@ -0,0 +1,34 @@
+import warnings
+
+import numpy as np
+
+from benchmarks.synthetic import synthetic_positions, synthetic_reserves
+from cascade import simulate_cascade
+
+
+def test_thin_liquidity_cascade_stays_finite():
+    reserves = synthetic_reserves(40)
+    reserves["totalLiquidity"] *= 1e-6  # sales drive several prices to 0
+    positions = synthetic_positions(20_000, reserves)
+    shock = {"supply-SYM0": 40, "supply-SYM1": 40}
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", RuntimeWarning)
+        result = simulate_cascade(positions, shock, reserves)
+
+    assert len(result["rounds"]) > 0
+    assert np.isfinite(result["rounds"].to_numpy(dtype=float)).all()
+    assert np.isfinite(result["prices"].to_numpy(dtype=float)).all()
+    accounts = result["accounts"]
+    # HF is inf for accounts without debt, everything else must be a number
+    assert not accounts[["HF_Before", "HF_Shocked", "HF_After"]].isna().any().any()
+    assert np.isfinite(accounts[["Liquidations", "Debt_Repaid", "Bad_Debt"]].to_numpy(dtype=float)).all()
+
+
+def test_no_shock_on_a_healthy_book_liquidates_nothing():
+    reserves = synthetic_reserves(10)
+    positions = synthetic_positions(400, reserves, deposit_share=1.0)
+    result = simulate_cascade(positions, None, reserves)
+    assert result["converged"]
+    assert result["rounds"].empty
+    assert (result["prices"]["Final_Price"] == result["prices"]["Price"]).all()
@@ -0,0 +1,68 @@
+import pandas as pd
+
+import fetch_data
+from calculations import (calculate_batch_metrics, calculate_hf, liquidation_prices, stress_test_calculation_multiple,
+                          symbol_exposures)
+from positions import CompactPortfolio, ReserveTable
+
+MARKETS = {
+    # The same USDC symbol on two chains, at different prices and thresholds
+    "https://ethereum": [("USDC", "1.0", "0.8"), ("WETH", "2000", "0.85")],
+    "https://arbitrum": [("USDC", "0.5", "0.7")],
+}
+
+
+def _multi_chain_reserves(monkeypatch):
+    closed = []
+
+    def paginate(client, entity, fields):
+        for symbol, price, threshold in MARKETS[client.url]:
+            yield {"inputToken": {"symbol": symbol, "lastPriceUSD": price}, "totalDepositBalanceUSD": "1e6",
+                   "totalBorrowBalanceUSD": "1e5", "liquidationThreshold": threshold}
+
+    monkeypatch.setattr(fetch_data.SubgraphClient, "paginate", paginate)
+    monkeypatch.setattr(fetch_data.SubgraphClient, "close", lambda client: closed.append(client.url))
+    reserves = fetch_data.get_reserves_multi({"ethereum": "https://ethereum", "arbitrum": "https://arbitrum"})
+    assert sorted(closed) == sorted(MARKETS)
+    return reserves
+
+
+def _positions(reserves):
+    positions = pd.DataFrame({
+        "account": ["a", "a", "a"],
+        "chain": ["ethereum", "arbitrum", "ethereum"],
+        "symbol": ["USDC", "USDC", "WETH"],
+        "Type": ["Deposit", "Deposit", "Borrow"],
+        "Amount": [1000.0, 1000.0, 0.5],
+    })
+    return positions.merge(reserves, on=["chain", "symbol"], how="left")
+
+
+def test_one_symbol_on_two_chains_stays_two_reserves(monkeypatch):
+    reserves = _multi_chain_reserves(monkeypatch)
+    positions = _positions(reserves)
+    hf = round((1000 * 1.0 * 0.8 + 1000 * 0.5 * 0.7) / (0.5 * 2000), 3)
+
+    table = ReserveTable.from_frame(reserves)
+    assert sorted(table.symbols) == ["arbitrum:USDC", "ethereum:USDC", "ethereum:WETH"]
+    portfolio = CompactPortfolio.from_frame(positions, table, "account")
+    assert len(set(portfolio.symbol.tolist())) == 3
+    assert calculate_hf(portfolio) == hf
+    assert calculate_batch_metrics(positions).loc["a", "HF"] == hf
+
+    exposures = symbol_exposures(positions)
+    assert exposures.loc["ethereum:USDC", "Collateral"] == 1000.0
+    assert exposures.loc["arbitrum:USDC", "Collateral"] == 500.0
+
+    liq = liquidation_prices(positions).set_index("symbol")
+    assert liq.loc["ethereum:USDC", "Price"] == 1.0
+    assert liq.loc["arbitrum:USDC", "Price"] == 0.5
+
+    # Shocking one chain's USDC leaves the other one alone
+    shock = {"supply-arbitrum:USDC": 50}
+    stressed, prices = stress_test_calculation_multiple(positions, shock)
+    assert stressed["Price"].tolist() == [1.0, 0.25, 2000.0]
+    assert prices == {"arbitrum:USDC": {"old": 0.5, "new": 0.25}}
+    stressed_hf = round((800 + 1000 * 0.25 * 0.7) / 1000, 3)
+    assert calculate_hf(stressed) == stressed_hf
+    assert calculate_hf(stress_test_calculation_multiple(portfolio, shock)[0]) == stressed_hf
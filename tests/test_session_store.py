@@ -0,0 +1,58 @@
+import os
+
+import pandas as pd
+
+from session_store import PortfolioStore
+
+
+def _portfolio(n=1000, shift=0.0):
+    return pd.DataFrame({"symbol": ["ETH"] * n, "Amount": [1.0 + shift] * n})
+
+
+def test_only_evicted_portfolios_are_spilled(tmp_path):
+    store = PortfolioStore(max_bytes=1, spill_dir=str(tmp_path))
+    df = _portfolio()
+    handle = store.put(df, store.content_handle(df))
+    assert not (tmp_path / f"{handle}.parquet").exists()
+
+    store.put(_portfolio(shift=1.0))  # evicts the first entry from memory
+    assert handle not in store._entries
+    assert (tmp_path / f"{handle}.parquet").exists()
+    for _ in range(2):
+        loaded = store.get(handle)
+        assert loaded is not None
+        pd.testing.assert_frame_equal(loaded, df)
+    assert (tmp_path / f"{handle}.parquet").exists()
+
+
+def test_persisted_put_is_visible_to_other_processes_sharing_the_directory(tmp_path):
+    worker_a = PortfolioStore(spill_dir=str(tmp_path))
+    worker_b = PortfolioStore(spill_dir=str(tmp_path))
+    df = _portfolio()
+    private = worker_a.put(_portfolio(shift=2.0))
+    handle = worker_a.put(df, worker_a.content_handle(df), persist=True)
+
+    assert worker_b.get(private) is None
+    pd.testing.assert_frame_equal(worker_b.get(handle), df)
+    worker_b.discard(handle)
+    assert worker_b.get(handle) is None
+    assert not (tmp_path / f"{handle}.parquet").exists()
+
+
+def test_spill_directory_is_capped_oldest_first(tmp_path):
+    store = PortfolioStore(spill_dir=str(tmp_path), spill_ttl=float("inf"), write_through=True)
+    handles = []
+    for i in range(4):
+        handles.append(store.put(_portfolio(shift=i)))
+        os.utime(tmp_path / f"{handles[-1]}.parquet", (1000 + i, 1000 + i))  # increasing ages
+    store.spill_max_bytes = 2.5 * (tmp_path / f"{handles[0]}.parquet").stat().st_size
+
+    newest = store.put(_portfolio(shift=10.0))
+    assert {p.stem for p in tmp_path.glob("*.parquet")} == {handles[3], newest}
+
+
+def test_memory_only_store_misses_after_eviction():
+    store = PortfolioStore(max_bytes=1, spill_dir="")
+    handle = store.put(_portfolio())
+    store.put(_portfolio(shift=1.0))
+    assert store.get(handle) is None
@@ -1,59 +1,66 @@
 # ------------------------- visualization.py -------------------------
 # Plotly-based visualization helpers so they can be embedded in Dash
+# Builders return serialized figure dicts memoized on their input values, so
+# repeated stress runs with identical results reuse the same figure. Treat
+# the returned dicts as read-only.
+from functools import lru_cache
+
+import numpy as np
 import plotly.graph_objects as go
-import plotly.express as px
 import pandas as pd
 
+
+@lru_cache(maxsize=256)
+def _before_after_figure(before, after, title, colors, yaxis_title=None):
+    fig = go.Figure(go.Bar(
+        x=['Before', 'After'],
+        y=[before, after],
+        text=[before, after],
+        texttemplate='%{text:.2f}',
+        textposition='outside',
+        marker_color=list(colors),
+    ))
+    fig.update_layout(title=title, template='plotly_white', yaxis_title=yaxis_title, showlegend=False)
+    return fig.to_dict()
+
 # HF bar chart
 def hf_bar_figure(hf_before, hf_after):
-    df = pd.DataFrame([
-        {'Scenario': 'Before', 'Value': hf_before},
-        {'Scenario': 'After', 'Value': hf_after}
-    ])
-    fig = px.bar(df, x='Scenario', y='Value', text='Value',
-                 color='Scenario', color_discrete_map={'Before':'#636EFA', 'After':'#EF553B'})
-    fig.update_traces(texttemplate='%{text:.2f}', textposition='outside')
-    fig.update_layout(title='Health Factor (HF) Before vs After Stress', template='plotly_white')
-    return fig
+    return _before_after_figure(hf_before, hf_after, 'Health Factor (HF) Before vs After Stress',
+                                ('#636EFA', '#EF553B'))
 
 # LTV bar chart
 def ltv_bar_figure(ltv_before, ltv_after):
-    df = pd.DataFrame([
-        {'Scenario': 'Before', 'Value': ltv_before},
-        {'Scenario': 'After', 'Value': ltv_after}
-    ])
-    fig = px.bar(df, x='Scenario', y='Value', text='Value',
-                 color='Scenario', color_discrete_map={'Before':'#00CC96', 'After':'#AB63FA'})
-    fig.update_traces(texttemplate='%{text:.2f}', textposition='outside')
-    fig.update_layout(title='Loan-to-Value (LTV) Before vs After Stress', template='plotly_white', yaxis_title='%')
-    return fig
+    return _before_after_figure(ltv_before, ltv_after, 'Loan-to-Value (LTV) Before vs After Stress',
+                                ('#00CC96', '#AB63FA'), '%')
 
-# Price change per coin (percentage)
-def price_change_figure(df_before: pd.DataFrame, df_after: pd.DataFrame):
-    before = df_before[['symbol','Price']].drop_duplicates().set_index('symbol')
-    after = df_after[['symbol','Price']].drop_duplicates().set_index('symbol')
-    merged = before.join(after, lsuffix='_before', rsuffix='_after', how='outer').reset_index().fillna(0)
-    
-    # % change
-    merged['Price_change_pct'] = (merged['Price_after'] - merged['Price_before']) / merged['Price_before'] * 100
-
-    fig = go.Figure()
-    for _, row in merged.iterrows():
-        fig.add_trace(go.Bar(
-            name=row['symbol'],
-            x=['% Change'],
-            y=[row['Price_change_pct']],
-            text=f"{row['Price_change_pct']:.2f}%",
-            textposition='outside'
-        ))
 
+@lru_cache(maxsize=256)
+def _price_change_figure(symbols, changes):
+    changes = np.array(changes, dtype=np.float64)
+    fig = go.Figure(go.Bar(
+        x=list(symbols),
+        y=changes,
+        text=[f"{c:.2f}%" for c in changes],
+        textposition='outside',
+        marker_color=np.where(changes < 0, '#EF553B', '#00CC96'),
+    ))
     fig.update_layout(
-        barmode='group',
         title='Price Change per Coin After Stress',
         template='plotly_white',
-        yaxis_title='Price Change (%)'
+        yaxis_title='Price Change (%)',
+        showlegend=False
     )
-    return fig
+    return fig.to_dict()
+
+# Price change per coin (percentage)
+def price_change_figure(df_before: pd.DataFrame, df_after: pd.DataFrame):
+    before = df_before[['symbol','Price']].drop_duplicates('symbol').set_index('symbol')
+    after = df_after[['symbol','Price']].drop_duplicates('symbol').set_index('symbol')
+    merged = before.join(after, lsuffix='_before', rsuffix='_after', how='outer').fillna(0)
+
+    # % change
+    change = (merged['Price_after'] - merged['Price_before']) / merged['Price_before'] * 100
+    return _price_change_figure(tuple(merged.index), tuple(change.tolist()))
 
 
 # ------------------------- END -------------------------